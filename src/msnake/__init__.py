@@ -1,11 +1,31 @@
-from .anysnake import Anysnake
-from .parser import parse_requirements, parsed_to_anysnake
+# Everything is imported on first access - 'msnake docker_tag' & co
+# should not pay for docker/requests/pkg_resources imports.
 
-from pkg_resources import get_distribution, DistributionNotFound
-try:
-    __version__ = get_distribution(__name__).version
-except DistributionNotFound:
-    # package is not installed
-    pass
 
-__all__ = [Anysnake, parse_requirements, parsed_to_anysnake, __version__]
+def __getattr__(name):
+    if name == "Anysnake":
+        from .anysnake import Anysnake
+
+        return Anysnake
+    elif name in ("parse_requirements", "parsed_to_anysnake"):
+        from . import parser
+
+        return getattr(parser, name)
+    elif name == "__version__":
+        try:
+            from importlib.metadata import version, PackageNotFoundError
+        except ImportError:  # python < 3.8
+            from pkg_resources import get_distribution, DistributionNotFound
+
+            try:
+                return get_distribution(__name__).version
+            except DistributionNotFound:
+                raise AttributeError(name)
+        try:
+            return version(__name__)
+        except PackageNotFoundError:  # package is not installed
+            raise AttributeError(name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+__all__ = ["Anysnake", "parse_requirements", "parsed_to_anysnake", "__version__"]
@@ -6,9 +6,17 @@ import requests
 import shutil
 import os
 import re
+import json
+import time
+import contextlib
+import resource
+import tempfile
+import hashlib
+import multiprocessing
+import pickle
 from pathlib import Path
+from sys import intern
 import packaging.version
-import pypipegraph as ppg
 
 # some packages are *duplicated* in the package index.
 # the default is, if the version is identical, to take the one with a md5sum.
@@ -166,6 +174,8 @@ build_in = {
 
 
 def install_bioconductor():
+    import pypipegraph as ppg
+
     bc_version = os.environ["BIOCONDUCTOR_VERSION"]
     cran_mode = os.environ["CRAN_MODE"]
     sources = ["cran", "software", "annotation", "experiment"]
@@ -184,14 +194,18 @@ def install_bioconductor():
     logging.basicConfig(
         filename="/anysnake/bioconductor/ppg.log", level=logging.INFO, filemode="w"
     )
-    cpus = int(ppg.util.CPUs() * 1.25)  # rule of thumb to achieve maximum throughupt
+    # more jobs than cores, since the compiles are limited by the jobserver
+    # and the memory ledger anyway, and jobs wait for their downloads
+    cpus = int(ppg.util.CPUs() * 1.25)
+    start_build_limits(int(os.environ.get("COMPILE_THREADS", ppg.util.CPUs())))
     ppg.new_pipegraph(
         invariant_status_filename="/anysnake/bioconductor/.ppg_status",
         resource_coordinator=ppg.resource_coordinators.LocalSystem(
             max_cores_to_use=cpus, interactive=False
         ),
     )
-    jobs, prune_because_of_missing_preqs = build_jobs(pkgs)
+    infos = {name: info for p in pkgs for (name, info) in p.items()}
+    jobs, prune_because_of_missing_preqs = build_jobs(pkgs, infos)
     # now we have jobs for *every* R package
     # which we now need to filter down
 
@@ -227,18 +241,90 @@ def install_bioconductor():
         to_prune.update(blacklist_per_version[bc_version])
     prune(jobs, to_prune)
 
-    ppg.util.global_pipegraph.connect_graph()
-    ppg.run_pipegraph()
+    to_download, priorities = plan_installs(
+        ppg.util.global_pipegraph, jobs, infos
+    )
+    run_with_download_stage(ppg, to_download, priorities)
     for j in ppg.util.global_pipegraph.job_uniquifier.values():
         if j._pruned:
             print("pruned", j.job_id, "because of", j._pruned)
     write_done_sentinel(cran_mode, whitelist)
 
 
+def start_build_limits(compile_threads):
+    """The jobserver and an empty memory ledger -
+    before the pipegraph forks its jobs"""
+    start_jobserver(compile_threads)
+    if os.path.exists(memory_ledger_filename):  # pids from the last run
+        os.unlink(memory_ledger_filename)
+
+
+def plan_installs(graph, jobs, infos):
+    """Order the graph's install jobs by critical path.
+    Returns the infos whose tarballs we need (not in the binary cache)
+    and the priorities (name -> expected seconds)"""
+    todo = get_todo(jobs)
+    to_download = []
+    for name in todo:
+        binary_fn = get_binary_cache_filename(infos[name], infos)
+        if binary_fn is None or not os.path.exists(binary_fn):
+            to_download.append(infos[name])
+    priorities = get_critical_path_priorities(todo, infos)
+    if priorities:
+        print(
+            "%i packages to install, expected critical path %.0fs"
+            % (len(priorities), max(priorities.values()))
+        )
+    prioritize_by_critical_path(
+        graph, {jobs[name][0].job_id: level for (name, level) in priorities.items()}
+    )
+    return to_download, priorities
+
+
+def run_with_download_stage(ppg, to_download, priorities):
+    """run_pipegraph, while the download stage fetches to_download"""
+    downloader = start_download_stage(to_download, priorities)
+    ppg.util.global_pipegraph.connect_graph()
+    try:
+        ppg.run_pipegraph()
+    finally:
+        downloader.terminate()
+        downloader.join()
+
+
+trace_filename = "/anysnake/bioconductor/trace.jsonl"
+
+
+def traced(name, category, func):
+    """Record the runtime of func into trace_filename (for msnake's tracing)
+    if ANYSNAKE_TRACE is set"""
+    if not os.environ.get("ANYSNAKE_TRACE"):
+        return func
+
+    def inner():
+        start = time.time()
+        try:
+            return func()
+        finally:
+            line = json.dumps(
+                {
+                    "name": name,
+                    "category": category,
+                    "start": start,
+                    "duration": time.time() - start,
+                    "pid": os.getpid(),
+                }
+            )
+            with open(trace_filename, "a") as op:
+                op.write(line + "\n")
+
+    return inner
+
+
 def prune(jobs, to_prune):
     for k in to_prune:
         if k in jobs:
-            for j in jobs[k]:  # download and install job.
+            for j in jobs[k]:  # install job
                 j.prune()
 
 
@@ -282,18 +368,16 @@ def get_preqs(info):
                 yield preq
 
 
-def build_jobs(pkgs):
-    """Build the package download & install jobs"""
+def build_jobs(pkgs, infos):
+    """Build the package install jobs. The downloads happen in
+    a separate stage, see start_download_stage"""
     jobs = {}
     for p in pkgs:
         items = list(p.items())  # mix it up
         # random.shuffle(items)
         for name, info in items:
             if not name in build_in:
-                download_job = job_download(info)
-                install_job = job_install(info)
-                install_job.depends_on(download_job)
-                jobs[name] = [download_job, install_job]
+                jobs[name] = [job_install(info, infos)]
 
     prune_because_of_missing_preqs = set()
     for p in pkgs:
@@ -310,34 +394,614 @@ def build_jobs(pkgs):
     return jobs, prune_because_of_missing_preqs
 
 
-def job_download(info):
-    """Download the package defined in info"""
-    target_fn = f'/anysnake/bioconductor_download/{info["repo"]}/{info["name"]}_{info["version"]}.tar.gz'
+download_dir = "/anysnake/bioconductor_download"
+download_connections = 16
+# if a partial download does not grow for this long, the install job takes over
+download_stale_after = 120
 
-    def download():
-        p = Path(target_fn)
-        p.parent.mkdir(exist_ok=True, parents=False)
-        r = requests.get(info["url"], stream=True)
-        if r.status_code != 200:
-            raise ValueError("Error return on %s %s " % (info["url"], r.status_code))
-        with open(str(target_fn) + "_temp", "wb") as op:
-            for block in r.iter_content(1024 * 1024):
-                op.write(block)
-        shutil.move(str(target_fn) + "_temp", str(target_fn))
 
-    job = ppg.TempFileGeneratingJob(target_fn, download)
-    job.ignore_code_changes()
-    return job
+def get_download_filename(info):
+    return f'{download_dir}/{info["repo"]}/{info["name"]}_{info["version"]}.tar.gz'
 
 
-def job_install(info):
-    """install the package defined in info"""
-    sentinel_file = Path(
-        "/anysnake/bioconductor/%s/%s.sentinel" % (info["name"], info["name"])
+def claim_download(target_fn):
+    """True if nobody else has started to download target_fn"""
+    try:
+        os.close(os.open(target_fn + ".claim", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+def get_session(connections):
+    """A requests session with connection pooling and retries with backoff"""
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(
+        total=5, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504)
+    )
+    adapter = HTTPAdapter(
+        pool_connections=8, pool_maxsize=connections, max_retries=retry
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def download(session, url, target_fn, attempts=5):
+    """Download url to target_fn (via target_fn.part).
+    Interrupted downloads are resumed with Range requests"""
+    part = target_fn + ".part"
+    for attempt in range(attempts):
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": "bytes=%i-" % have} if have else {}
+        try:
+            with session.get(url, stream=True, headers=headers, timeout=60) as r:
+                if r.status_code == 416 and have:  # we already have all of it
+                    break
+                if r.status_code not in (200, 206):
+                    raise ValueError("Error return on %s %s " % (url, r.status_code))
+                # 200 - the server ignored the range, start over
+                with open(part, "ab" if r.status_code == 206 else "wb") as op:
+                    for block in r.iter_content(1024 * 1024):
+                        op.write(block)
+            break
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ):
+            if attempt == attempts - 1:
+                raise
+            time.sleep(2 ** attempt)
+    os.rename(part, target_fn)
+
+
+def download_all(infos, connections):
+    """Download the tarballs of infos, connections at a time, in one session"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    session = get_session(connections)
+
+    def fetch(info):
+        target_fn = get_download_filename(info)
+        if os.path.exists(target_fn) or not claim_download(target_fn):
+            return
+        try:
+            traced(
+                "download " + info["name"],
+                "download",
+                lambda: download(session, info["url"], target_fn),
+            )()
+        except Exception as e:  # the install job will try again
+            Path(target_fn + ".failed").write_text(str(e))
+
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        list(pool.map(fetch, infos))
+
+
+def start_download_stage(infos, priorities):
+    """Download all infos in a separate process, while the install jobs run.
+    Packages with few dependencies are needed first, so they go first,
+    and among those the ones the scheduler will start first"""
+    for repo in set(info["repo"] for info in infos):
+        repo_dir = Path(download_dir) / repo
+        repo_dir.mkdir(exist_ok=True)
+        for fn in repo_dir.iterdir():  # left over from an interrupted run
+            if fn.name.endswith((".claim", ".failed")):
+                fn.unlink()
+    by_name = {info["name"]: info for info in infos}
+    depths = {}
+
+    def depth(info, seen=()):
+        name = info["name"]
+        if name not in depths:
+            preqs = [x for x in get_preqs(info) if x in by_name and x not in seen]
+            depths[name] = 1 + max(
+                [depth(by_name[x], seen + (name,)) for x in preqs], default=0
+            )
+        return depths[name]
+
+    infos = sorted(
+        infos,
+        key=lambda info: (
+            depth(info),
+            -priorities.get(info["name"], 0),
+            info["name"],
+        ),
+    )
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+    p = multiprocessing.Process(
+        target=download_all, args=(infos, download_connections)
     )
+    p.start()
+    return p
+
+
+def wait_for_download(info):
+    """Wait for the download stage to deliver info's tarball -
+    or download it ourselves if it has not started on it, failed,
+    or stalled"""
+    target_fn = get_download_filename(info)
+    part = target_fn + ".part"
+    while not os.path.exists(target_fn):
+        stalled = (
+            os.path.exists(part)
+            and time.time() - os.path.getmtime(part) > download_stale_after
+        )
+        failed = os.path.exists(target_fn + ".failed")
+        if claim_download(target_fn) or failed or stalled:
+            download(get_session(1), info["url"], target_fn)
+            break
+        time.sleep(0.5)
+    return target_fn
+
+
+# for packages we have never build
+default_duration = 30
+# unpacking a cached binary package
+binary_duration = 2
+
+
+def get_install_history_path():
+    """Source build durations and peak memory of all packages ever build here,
+    one file per package. Shared via the binary package cache if we have one"""
+    if os.environ.get("R_PACKAGE_CACHE"):
+        return Path(os.environ["R_PACKAGE_CACHE"]) / "install_history"
+    return Path(download_dir) / "install_history"
+
+
+def record_install(info, how, seconds, peak_rss):
+    """Store the install duration (and peak memory) next to the sentinel file,
+    and those of source builds in the install history"""
+    stats = {"seconds": seconds, "peak_rss": peak_rss}
+    target_dir = Path("/anysnake/bioconductor") / info["name"]
+    (target_dir / (info["name"] + ".install.json")).write_text(
+        json.dumps(dict(stats, version=info["version"], how=how))
+    )
+    if how == "source":
+        history = get_install_history_path()
+        try:
+            history.mkdir(exist_ok=True, parents=True)
+            temp = history / (".%s.%i" % (info["name"], os.getpid()))
+            temp.write_text(json.dumps(stats))
+            temp.rename(history / info["name"])
+        except OSError:
+            pass
+
+
+install_history = None
+
+
+def load_install_history():
+    """name -> {'seconds':, 'peak_rss':} of the last source build.
+    Loaded once (before the pipegraph forks its jobs)"""
+    global install_history
+    if install_history is None:
+        install_history = {}
+        history = get_install_history_path()
+        if history.exists():
+            for fn in history.iterdir():
+                if not fn.name.startswith("."):
+                    try:
+                        install_history[fn.name] = json.loads(fn.read_text())
+                    except (OSError, ValueError):
+                        pass
+    return install_history
+
+
+def get_todo(jobs):
+    """The names of the packages the pipegraph will install -
+    not pruned (themselves or via a prerequisite) and not done yet"""
+    pruned = {}
+
+    def is_pruned(job):
+        if job.job_id not in pruned:
+            pruned[job.job_id] = bool(job._pruned) or any(
+                is_pruned(x) for x in job.prerequisites
+            )
+        return pruned[job.job_id]
+
+    return set(
+        name
+        for (name, (install_job,)) in jobs.items()
+        if not is_pruned(install_job) and not Path(install_job.job_id).exists()
+    )
+
+
+def get_critical_path_priorities(todo, infos):
+    """name -> expected duration of the longest chain of installs
+    starting with it (the package's 'bottom level'). Running the jobs with the
+    highest values first gets the total time close to the critical path"""
+    history = {
+        name: stats["seconds"] for (name, stats) in load_install_history().items()
+    }
+    if history:
+        known = sorted(history.values())
+        fallback = known[len(known) // 2]
+    else:
+        fallback = default_duration
+    dependants = {name: [] for name in todo}
+    for name in todo:
+        for preq in get_preqs(infos[name]):
+            if preq in dependants and preq != name:
+                dependants[preq].append(name)
+
+    def expected(name):
+        binary_fn = get_binary_cache_filename(infos[name], infos)
+        if binary_fn and os.path.exists(binary_fn):
+            return binary_duration
+        return history.get(name, fallback)
+
+    levels = {}
+    for start in todo:  # iterative post order dfs - the chains can be long
+        stack = [(start, False)]
+        while stack:
+            name, children_done = stack.pop()
+            if name in levels:
+                continue
+            if children_done:
+                levels[name] = expected(name) + max(
+                    [levels.get(x, 0) for x in dependants[name]], default=0
+                )
+            else:
+                stack.append((name, True))
+                stack.extend((x, False) for x in dependants[name] if x not in levels)
+    return levels
+
+
+def prioritize_by_critical_path(graph, priorities):
+    """Make the pipegraph start runnable jobs in order of priorities (job_id ->).
+
+    pypipegraph starts them in possible_execution_order order, which
+    build_todo_list fills - both are internals, so if this pypipegraph
+    does not have them, we leave its order alone.
+    Returns whether the order was hooked in."""
+    build_todo_list = getattr(graph, "build_todo_list", None)
+    if build_todo_list is None:
+        print("pypipegraph has no build_todo_list - not ordering by critical path")
+        return False
+    warned = []
+
+    def sorted_build_todo_list(*args, **kwargs):
+        result = build_todo_list(*args, **kwargs)
+        order = getattr(graph, "possible_execution_order", None)
+        if isinstance(order, list):
+            order.sort(key=lambda job: -priorities.get(job.job_id, 0))
+        elif not warned:
+            print("pypipegraph has no possible_execution_order - not reordering")
+            warned.append(True)
+        return result
+
+    graph.build_todo_list = sorted_build_todo_list
+    return True
+
+
+# GNU make jobserver pipe (read, write) - limits the compiler processes of
+# all installs together. Every source install holds one token while it runs
+# (for itself / make's implicit job slot), make takes more for parallel jobs.
+# Those makes are children of the install, whose memory reservation covers
+# its whole process tree (see measure_peak_memory) - so tokens are only held
+# while a reservation is, and when the memory ledger is empty, all tokens
+# must be back (see refill_jobserver)
+jobserver_fds = None
+jobserver_tokens = 0
+
+
+def start_jobserver(tokens):
+    """Create the jobserver pipe - before the pipegraph forks, so all jobs
+    inherit it"""
+    global jobserver_fds, jobserver_tokens
+    read, write = os.pipe()
+    os.write(write, b"+" * tokens)
+    jobserver_fds = (read, write)
+    jobserver_tokens = tokens
+
+
+def get_available_tokens():
+    import array
+    import fcntl
+    import termios
+
+    buf = array.array("i", [0])
+    fcntl.ioctl(jobserver_fds[0], termios.FIONREAD, buf, True)
+    return buf[0]
+
+
+def refill_jobserver():
+    """Put back the tokens lost by processes that died holding them
+    (a killed install job, or make) - only call while nobody holds one"""
+    missing = jobserver_tokens - get_available_tokens()
+    if missing > 0:
+        print("jobserver: %i lost tokens returned" % missing)
+        os.write(jobserver_fds[1], b"+" * missing)
+
+
+def read_token():
+    """Wait for a token. The read end is shared with all makes, and some
+    set it O_NONBLOCK - then another process taking the token between select
+    and read raises BlockingIOError, and we wait again"""
+    import select
+
+    while True:
+        select.select([jobserver_fds[0]], [], [])
+        try:
+            token = os.read(jobserver_fds[0], 1)
+        except BlockingIOError:
+            continue
+        if token:
+            return token
+
+
+@contextlib.contextmanager
+def jobserver_token():
+    if jobserver_fds is None:
+        yield
+        return
+    token = read_token()
+    try:
+        yield
+    finally:
+        os.write(jobserver_fds[1], token)
+
+
+memory_ledger_filename = "/anysnake/bioconductor/.memory_ledger"
+# the share of the (container's) memory all running installs may reserve
+memory_fraction = 0.8
+# expected peak memory of a build if we know none
+default_peak_rss = 512 * 1024 ** 2
+
+
+def get_memory_budget():
+    """memory_fraction of the physical memory or the cgroup limit, if lower"""
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    for fn in (
+        "/sys/fs/cgroup/memory.max",  # cgroup v2
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",  # v1
+    ):
+        try:
+            total = min(total, int(Path(fn).read_text().strip()))
+        except (OSError, ValueError):  # not there / 'max'
+            pass
+    return int(total * memory_fraction)
+
+
+def get_tree_rss(pid):
+    """The summed resident memory of pid and all its descendants, from /proc"""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry) as op:
+                stat = op.read()
+        except OSError:  # exited meanwhile
+            continue
+        # the command (2nd field) may contain spaces - split after its ')'
+        fields = stat[stat.rindex(")") + 2 :].split()
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * page_size
+    total = 0
+    todo = [pid]
+    while todo:
+        pid = todo.pop()
+        total += rss.get(pid, 0)
+        todo.extend(children.get(pid, []))
+    return total
+
+
+def measure_peak_memory(p, interval=0.5):
+    """p.communicate() - and the peak of the summed memory of p's process tree
+    meanwhile (sampled), ie. that of all parallel compiler processes of a build.
+    0 if /proc is not available"""
+    import threading
+
+    peak = [0]
+    done = threading.Event()
+
+    def sample():
+        while True:
+            try:
+                peak[0] = max(peak[0], get_tree_rss(p.pid))
+            except OSError:
+                return
+            if done.wait(interval):
+                return
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    try:
+        stdout, stderr = p.communicate()
+    finally:
+        done.set()
+        thread.join()
+    return stdout, stderr, peak[0]
+
+
+def get_expected_peak_rss(name):
+    """The peak memory of name's last build, or the median of all we know"""
+    history = load_install_history()
+    if history.get(name, {}).get("peak_rss"):
+        return history[name]["peak_rss"]
+    known = sorted(x["peak_rss"] for x in history.values() if x.get("peak_rss"))
+    if known:
+        return known[len(known) // 2]
+    return default_peak_rss
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextlib.contextmanager
+def memory_ledger():
+    """The reservations (pid -> [name, bytes]) of the running installs,
+    locked - changes are written back. Dead pids are dropped, and once
+    no install is running, lost jobserver tokens are refilled"""
+    import fcntl
+
+    with open(memory_ledger_filename + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            ledger = json.loads(Path(memory_ledger_filename).read_text())
+        except (OSError, ValueError):
+            ledger = {}
+        ledger = {pid: v for (pid, v) in ledger.items() if pid_alive(int(pid))}
+        if not ledger and jobserver_fds is not None:
+            refill_jobserver()
+        yield ledger
+        Path(memory_ledger_filename).write_text(json.dumps(ledger))
+
+
+@contextlib.contextmanager
+def memory_reservation(name, needed, budget=None):
+    """Wait until needed bytes fit into the memory budget next to the
+    reservations of the other running installs (one install is always admitted)"""
+    if budget is None:
+        budget = get_memory_budget()
+    pid = str(os.getpid())
+    while True:
+        with memory_ledger() as ledger:
+            in_use = sum(v[1] for v in ledger.values())
+            if not ledger or in_use + needed <= budget:
+                ledger[pid] = [name, needed]
+                break
+        time.sleep(1)
+    try:
+        yield
+    finally:
+        with memory_ledger() as ledger:
+            ledger.pop(pid, None)
+
+
+def get_binary_cache_filename(info, infos):
+    """Where R CMD INSTALL --build's output for info is cached (or None if
+    the cache is disabled).
+
+    Keyed by docker image, R version, package name & version - and the versions
+    of the LinkingTo packages, whose headers are compiled into the binary"""
+    cache_path = os.environ.get("R_PACKAGE_CACHE")
+    if not cache_path:
+        return None
+    linking_to = sorted(
+        "%s_%s" % (x, infos[x]["version"]) for x in info["LinkingTo"] if x in infos
+    )
+    postfix = ""
+    if linking_to:
+        h = hashlib.sha256(":".join(linking_to).encode("utf-8"))
+        postfix = "_" + h.hexdigest()[:16]
+    return "%s/%s/R-%s/%s_%s%s.tar.gz" % (
+        cache_path,
+        re.sub("[^A-Za-z0-9_.-]", "_", os.environ["DOCKER_IMAGE"]),
+        os.environ["R_VERSION"],
+        info["name"],
+        info["version"],
+        postfix,
+    )
+
+
+def get_r_env():
+    env = os.environ.copy()
+    env[
+        "R_DONT_USE_TK"
+    ] = "true"  # otherwise the tk package will loop endlessly on modern linux
+    env["R_LIBS_SITE"] = "/anysnake/bioconductor"
+    env["R_LIBS_USER"] = ""
+    env["PATH"] = ":".join(env["PATH"].split(":") + ["/anysnake/R/bin"])
+    env["PYTHONPATH"] = ":".join(
+        env.get("PYTHONPATH", "").split(":") + [x for x in sys.path if x]
+    )
+    env["LIBRARY_PATH"] = ":".join(
+        env.get("LIBRARY_PATH", "").split(":") + ["/dockeractor/python/lib"]
+    )
+    env["LD_LIBRARY_PATH"] = ":".join(
+        env.get("LD_LIBRARY_PATH", "").split(":") + ["/dockeractor/python/lib"]
+    )
+    if jobserver_fds:
+        # make < 4.2 knows --jobserver-fds, newer ones --jobserver-auth,
+        # both ignore unknown options in MAKEFLAGS
+        env["MAKEFLAGS"] = "-j --jobserver-fds=%i,%i --jobserver-auth=%i,%i" % (
+            jobserver_fds * 2
+        )
+    else:
+        env["MAKEFLAGS"] = "-j %i" % (multiprocessing.cpu_count(),)
+    return env
+
+
+def install_binary(info, binary_fn, sentinel_file):
+    """Unpack a cached binary package. True on success"""
+    target_dir = Path("/anysnake/bioconductor") / info["name"]
+    p = subprocess.Popen(
+        [
+            "/anysnake/R/bin/R",
+            "CMD",
+            "INSTALL",
+            "-l",
+            "/anysnake/bioconductor",
+            binary_fn,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=get_r_env(),
+    )
+    stdout, stderr = p.communicate()
+    target_dir.mkdir(exist_ok=True)
+    (target_dir / "stdout").write_bytes(stdout)
+    (target_dir / "stderr").write_bytes(stderr)
+    if p.returncode != 0:
+        return False
+    sentinel_file.write_text("done\n")
+    return True
+
+
+def store_binary(build_dir, info, binary_fn):
+    """Move the binary package R CMD INSTALL --build left in build_dir
+    into the cache"""
+    build_dir = Path(build_dir)
+    candidates = list(build_dir.glob("%s_*.tar.gz" % info["name"]))
+    if len(candidates) == 1:
+        Path(binary_fn).parent.mkdir(exist_ok=True, parents=True)
+        temp = "%s.%i" % (binary_fn, os.getpid())
+        shutil.move(str(candidates[0]), temp)
+        os.rename(temp, binary_fn)
+
+
+def get_sentinel_filename(info):
+    return "/anysnake/bioconductor/%s/%s.sentinel" % (info["name"], info["name"])
+
+
+def job_install(info, infos):
+    """install the package defined in info"""
+    import pypipegraph as ppg
+
+    sentinel_file = Path(get_sentinel_filename(info))
 
     def do():
+        start = time.time()
+        how, peak_rss = install()
+        record_install(info, how, time.time() - start, peak_rss)
+
+    def install():
+        binary_fn = get_binary_cache_filename(info, infos)
+        if binary_fn and os.path.exists(binary_fn):
+            if install_binary(info, binary_fn, sentinel_file):
+                return "binary", None
+            # fall back to building from source
+        tarball = wait_for_download(info)
         R_cmd = ["/anysnake/R/bin/R", "--no-save"]
+        install_opts = ["'--no-docs'", "'--no-multiarch'"]
+        if binary_fn:
+            install_opts.append("'--build'")
         r_build_script = """
 
         lib = "/anysnake/bioconductor/"
@@ -354,18 +1018,17 @@ def job_install(info):
             }
         }
         print(Sys.getenv())
-        install.packages("/anysnake/bioconductor_download/%s/%s_%s.tar.gz",
+        install.packages("%s",
                 lib=lib,
                 repos=NULL,
                 type='source',
-                install_opts = c('--no-docs', '--no-multiarch')
+                INSTALL_opts = c(%s)
                 )
         write("done", "%s" )
         """ % (
             "T" if "reticulte" in get_preqs(info) else "F",
-            info["repo"],
-            info["name"],
-            info["version"],
+            tarball,
+            ", ".join(install_opts),
             str(sentinel_file),
         )
         # tf = tempfile.NamedTemporaryFile(suffix=".r")
@@ -375,50 +1038,59 @@ def job_install(info):
         tf.write_bytes(r_build_script.encode("utf-8"))
         # tf.flush()
         # tf.seek(0, 0)
-        env = os.environ.copy()
-        env[
-            "R_DONT_USE_TK"
-        ] = "true"  # otherwise the tk package will loop endlessly on modern linux
-        env["R_LIBS_SITE"] = "/anysnake/bioconductor"
-        env["R_LIBS_USER"] = ""
-        env["PATH"] = ":".join(env["PATH"].split(":") + ["/anysnake/R/bin"])
-        env["PYTHONPATH"] = ":".join(
-            env.get("PYTHONPATH", "").split(":") + [x for x in sys.path if x]
-        )
-        env["LIBRARY_PATH"] = ":".join(
-            env.get("LIBRARY_PATH", "").split(":") + ["/dockeractor/python/lib"]
-        )
-        env["LD_LIBRARY_PATH"] = ":".join(
-            env.get("LD_LIBRARY_PATH", "").split(":") + ["/dockeractor/python/lib"]
-        )
-        env["MAKEFLAGS"] = "-j %i" % (ppg.util.CPUs(),)
-
-        p = subprocess.Popen(
-            " ".join(R_cmd),
-            shell=True,
-            stdin=open(tf),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env,
-        )
-        stdout, stderr = p.communicate()
+        # --build writes the binary package into the cwd
+        build_dir = tempfile.mkdtemp(dir=download_dir)
+        with memory_reservation(
+            info["name"], get_expected_peak_rss(info["name"])
+        ), jobserver_token():
+            p = subprocess.Popen(
+                " ".join(R_cmd),
+                shell=True,
+                stdin=open(tf),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=get_r_env(),
+                cwd=build_dir,
+                pass_fds=jobserver_fds or (),
+            )
+            stdout, stderr, peak_rss = measure_peak_memory(p)
+        if not peak_rss:  # no /proc - the largest single process R spawned
+            peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
         target_dir_existed = target_dir.exists()
         target_dir.mkdir(exist_ok=True)
         tf.write_bytes(r_build_script.encode("utf-8"))
         (target_dir / "stdout").write_bytes(stdout)
         (target_dir / "stderr").write_bytes(stderr)
-        if p.returncode != 0 or not target_dir_existed:
-            print(stdout)
-            print(stderr)
-            raise ValueError("R error return code")
-        else:
-            pass  # sentinel file get's written by R upon completion
-
-    job = ppg.FileGeneratingJob(sentinel_file, do)
+        try:
+            if p.returncode != 0 or not target_dir_existed:
+                print(stdout)
+                print(stderr)
+                raise ValueError("R error return code")
+            else:
+                # sentinel file get's written by R upon completion
+                if binary_fn:
+                    store_binary(build_dir, info, binary_fn)
+                for fn in (tarball, tarball + ".claim"):
+                    if os.path.exists(fn):
+                        os.unlink(fn)
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+        return "source", peak_rss
+
+    job = ppg.FileGeneratingJob(
+        sentinel_file, traced("install " + info["name"], "install", do)
+    )
     job.ignore_code_changes()
     return job
 
 
+re_dcf_key = re.compile("([A-Za-z0-9_]+):")
+# 'R (>= 3.5), methods,grid' -> R, methods, grid
+re_dcf_dependency_names = re.compile(r"(?:^|,) ?([^ (),]+)")
+# bump when the parsed format changes
+parsed_cache_version = 1
+
+
 class RPackageInfo:
     """Caching parser for CRAN style packages lists"""
 
@@ -432,82 +1104,149 @@ class RPackageInfo:
         package -> depends, imports, suggests, version
         """
         if not hasattr(self, "_packages"):
-            raw = self.cache_filename.read_text()
-            pkgs = {}
-            errors = []
-            for p in self.parse(raw):
-                p["name"] = p["Package"]
-                for x in ("Depends", "Suggests", "Imports", "LinkingTo"):
-                    p[x.lower()] = set(p[x]) - build_in
-                p["version"] = p["Version"] if p["Version"] else ""
-                p["url"] = (
-                    self.base_url
-                    + "src/contrib/"
-                    + p["name"]
-                    + "_"
-                    + p["version"]
-                    + ".tar.gz"
+            self._packages = self.load_cached()
+            if self._packages is None:
+                with open(
+                    str(self.cache_filename), encoding="utf-8", errors="replace"
+                ) as op:
+                    self._packages = self.build_packages(self.parse(op))
+                self.store_cached(self._packages)
+        return self._packages
+
+    def get_cache_key(self):
+        """sha256 of the PACKAGES file and everything else that goes
+        into the parsed result"""
+        h = hashlib.sha256()
+        h.update(
+            repr(
+                (
+                    parsed_cache_version,
+                    self.base_url,
+                    self.name,
+                    sorted(build_in),
+                    sorted(duplicate_handling.get(self.name, {}).items()),
                 )
-                p["repo"] = self.name
-                if p["name"] in pkgs:
-                    what_to_do = duplicate_handling.get(self.name, {}).get(
-                        p["name"], "with_md5"
-                    )
-                    if what_to_do == "last":
-                        pkgs[p["name"]] = p
-                    elif what_to_do == "first":
-                        pass
-                    elif what_to_do == "smaller" or what_to_do == "larger":
-                        v1 = parse_version(pkgs[p["name"]]["version"])
-                        v2 = parse_version(p["version"])
-                        if what_to_do == "smaller":
-                            if v1 < v2:
-                                pass
-                            else:
-                                pkgs[p["name"]] = p
+            ).encode("utf-8")
+        )
+        with open(str(self.cache_filename), "rb") as op:
+            for block in iter(lambda: op.read(1024 * 1024), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def get_parsed_cache_filename(self):
+        return self.cache_filename.with_name(self.cache_filename.name + ".pickle")
+
+    def load_cached(self):
+        """The parsed packages from the last run, if the PACKAGES file is unchanged"""
+        self._cache_key = self.get_cache_key()
+        try:
+            with open(str(self.get_parsed_cache_filename()), "rb") as op:
+                key, packages = pickle.load(op)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if key != self._cache_key:
+            return None
+        return packages
+
+    def store_cached(self, packages):
+        fn = self.get_parsed_cache_filename()
+        temp = fn.with_name(fn.name + ".%i" % os.getpid())
+        try:
+            with open(str(temp), "wb") as op:
+                pickle.dump((self._cache_key, packages), op, pickle.HIGHEST_PROTOCOL)
+            temp.rename(fn)
+        except OSError:
+            pass
+
+    def build_packages(self, parsed):
+        """Name -> package info from the parsed PACKAGES entries,
+        with duplicates resolved"""
+        pkgs = {}
+        errors = []
+        for p in parsed:
+            p["name"] = p["Package"]
+            for x in ("Depends", "Suggests", "Imports", "LinkingTo"):
+                # shared if there's nothing to remove - keeps the cache small
+                p[x.lower()] = (
+                    p[x] - build_in if not p[x].isdisjoint(build_in) else p[x]
+                )
+            p["version"] = p["Version"] if p["Version"] else ""
+            p["url"] = (
+                self.base_url
+                + "src/contrib/"
+                + p["name"]
+                + "_"
+                + p["version"]
+                + ".tar.gz"
+            )
+            p["repo"] = self.name
+            if p["name"] in pkgs:
+                what_to_do = duplicate_handling.get(self.name, {}).get(
+                    p["name"], "with_md5"
+                )
+                if what_to_do == "last":
+                    pkgs[p["name"]] = p
+                elif what_to_do == "first":
+                    pass
+                elif what_to_do == "smaller" or what_to_do == "larger":
+                    v1 = parse_version(pkgs[p["name"]]["version"])
+                    v2 = parse_version(p["version"])
+                    if what_to_do == "smaller":
+                        if v1 < v2:
+                            pass
+                        else:
+                            pkgs[p["name"]] = p
+                    else:
+                        if v1 < v2:
+                            pkgs[p["name"]] = p
+                        else:
+                            pass
+                elif what_to_do == "with_md5":
+                    if p["version"] == pkgs[p["name"]]["version"]:
+                        if "MD5sum" in p:
+                            pkgs[p["name"]] = p
+                        elif "MD5sum" in pkgs[p["name"]]:
+                            pass
                         else:
-                            if v1 < v2:
-                                pkgs[p["name"]] = p
-                            else:
-                                pass
-                    elif what_to_do == "with_md5":
-                        if p["version"] == pkgs[p["name"]]["version"]:
-                            if "MD5sum" in p:
-                                pkgs[p["name"]] = p
-                            elif "MD5sum" in pkgs[p["name"]]:
-                                pass
-                            else:
-                                errors.append((p, pkgs[p["name"]]))
-                        else:  # unequal version, can't decide by md5
                             errors.append((p, pkgs[p["name"]]))
-                    else:  # pragma: no cover raise - defensive branch
+                    else:  # unequal version, can't decide by md5
                         errors.append((p, pkgs[p["name"]]))
+                else:  # pragma: no cover raise - defensive branch
+                    errors.append((p, pkgs[p["name"]]))
 
-                else:
-                    pkgs[p["name"]] = p
-            if errors:
-                print("Number of duplicate, unhandled packages", len(errors))
-                for p1, p2 in errors:
-                    import pprint
-
-                    print(p1["name"])
-                    pprint.pprint(p1)
-                    pprint.pprint(p2)
-                    print("")
-                raise ValueError("Duplicate packages within %s repository!"  %self.name)
-
-            self._packages = pkgs
-        return self._packages
+            else:
+                pkgs[p["name"]] = p
+        if errors:
+            print("Number of duplicate, unhandled packages", len(errors))
+            for p1, p2 in errors:
+                import pprint
+
+                print(p1["name"])
+                pprint.pprint(p1)
+                pprint.pprint(p2)
+                print("")
+            raise ValueError("Duplicate packages within %s repository!"  %self.name)
+        return pkgs
 
-    def parse(self, raw):
-        lines = raw.split("\n")
+    def parse(self, lines):
+        """Parse a PACKAGES (debian control file format) text
+        (or any iterable of lines, e.g. an open file) into a list of dicts"""
+        if isinstance(lines, str):
+            lines = lines.split("\n")
         result = []
         current = {}
+        key = None
+        continued = []  # continuation lines of key
+        match_key = re_dcf_key.match
+        find_dependency_names = re_dcf_dependency_names.findall
         for line in lines:
-            m = re.match("([A-Za-z0-9_]+):", line)
+            m = match_key(line)
             if m:
-                key = m.groups()[0]
-                value = line[line.find(":") + 2 :].strip()
+                if continued:
+                    current[key] += "".join(continued)
+                    continued = []
+                key = intern(m.group(1))
+                value = line[m.end() + 1 :].strip()
                 if key == "Package":
                     if current:
                         result.append(current)
@@ -515,17 +1254,21 @@ class RPackageInfo:
                 if key in current:
                     raise ValueError(key)
                 current[key] = value
-            elif line.strip():
-                current[key] += line.strip()
+            else:
+                line = line.strip()
+                if line:
+                    continued.append(line)
+        if continued:
+            current[key] += "".join(continued)
 
         if current:
             result.append(current)
         for current in result:
             for k in ["Depends", "Imports", "Suggests", "LinkingTo"]:
                 if k in current:
-                    current[k] = re.split(", ?", current[k].strip())
+                    # interned - the pickled cache then stores each name once
                     current[k] = set(
-                        [re.findall("^[^ ()]+", x)[0] for x in current[k] if x]
+                        map(intern, find_dependency_names(current[k].strip()))
                     )
                 else:
                     current[k] = set()
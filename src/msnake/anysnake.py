@@ -1,18 +1,16 @@
 # -*- coding: future_fstrings -*-
 
 from pathlib import Path
-from docker import from_env as docker_from_env
-import time
 import pwd
 import tempfile
 import shutil
 import subprocess
 import os
 import multiprocessing
-import sys
 import json
+import hashlib
+import threading
 
-import mbf_anysnake
 from .dockfill_docker import DockFill_Docker
 from .dockfill_python import (
     DockFill_Python,
@@ -24,7 +22,15 @@ from .dockfill_clone import DockFill_Clone
 from .dockfill_r import DockFill_R, DockFill_Rpy2
 from .dockfill_bioconductor import DockFill_Bioconductor
 from .dockfill_rust import DockFill_Rust
-from .util import combine_volumes, get_next_free_port
+from .scheduler import run_strategies
+from .build_cache import BuildCache, key_filename, make_temp_dir
+from .state_manifest import StateManifest
+from .version_index import VersionIndex
+from .warm_container import WarmContainer
+from .util import combine_volumes, get_next_free_port, is_success, LogSink
+from . import tracing
+from . import compiler_cache
+from . import wheelhouse as wheelhouse_module
 
 
 class Anysnake:
@@ -67,8 +73,31 @@ class Anysnake:
         docker_build_cmds="",
         global_clones={},
         local_clones={},
+        parallel_builds=4,
+        build_cache_path=None,
+        console_verbosity="full",
+        compiler_cache=True,
+        compiler_cache_size="10G",
+        version_index_ttl=24 * 3600,
+        wheelhouse=True,
+        wheelhouse_size="20G",
+        clone_jobs=8,
+        clone_options={},
+        clone_mirrors=True,
+        venv_installer="poetry",
+        r_package_cache=True,
     ):
         self.cores = cores if cores else multiprocessing.cpu_count()
+        self.parallel_builds = parallel_builds
+        self.clone_jobs = clone_jobs
+        self.clone_options = clone_options
+        self.venv_installer = venv_installer
+        self.r_package_cache = r_package_cache
+        self.console_verbosity = console_verbosity
+        self.compiler_cache = compiler_cache
+        self.compiler_cache_size = compiler_cache_size
+        self.wheelhouse = wheelhouse
+        self.wheelhouse_size = wheelhouse_size
         self.cran_mirror = cran_mirror
         if not self.cran_mirror.endswith("/"):
             self.cran_mirror += "/"
@@ -82,7 +111,7 @@ class Anysnake:
         code_path = Path(code_path).absolute()
         self.storage_per_hostname = bool(storage_per_hostname)
 
-        bin_path = Path(mbf_anysnake.__path__[0]).parent.parent / "bin"
+        bin_path = Path(__file__).parent.parent.parent / "bin"
 
         self.paths = {
             "bin": bin_path,
@@ -93,10 +122,33 @@ class Anysnake:
             "log_code": code_path / "logs",
             "per_user": Path("~").expanduser() / ".anysnake",
             "home_inside_docker": "/home/%s" % self.get_login_username(),
+            "storage_ccache": storage_path / "ccache",
+            # clones don't depend on the docker image - share them between all
+            "storage_mirrors": self.storage_path / "mirrors",
+            "storage_wheelhouse": wheelhouse_module.get_path(
+                storage_path, python_version
+            ),
+            "ensure_manifest": storage_path
+            / "ensure_state"
+            / (hashlib.md5(str(code_path).encode("utf-8")).hexdigest() + ".json"),
         }
         self.paths["per_user"].mkdir(exist_ok=True)
+        self.paths["build_cache"] = (
+            Path(build_cache_path)
+            if build_cache_path
+            else self.paths["per_user"] / "build_cache"
+        )
+        self.build_cache = BuildCache(self.paths["build_cache"])
+        self.clone_mirror_path = (
+            self.paths["storage_mirrors"].absolute() if clone_mirrors else None
+        )
+        self.paths["version_index"] = self.paths["per_user"] / "version_index"
+        self.version_index = VersionIndex(
+            self.paths["version_index"], version_index_ttl
+        )
 
         dfd = DockFill_Docker(self, docker_build_cmds)
+        self.dockfill_docker = dfd
         self.project_name = project_name
 
         self.python_version = python_version
@@ -114,54 +166,17 @@ class Anysnake:
         self.global_clones = global_clones
         self.local_clones = local_clones
 
-        dfp = DockFill_Python(self)
-        dfgv = DockFill_GlobalVenv(self, dfp)
-        if self.rust_versions:
-            self.dockfill_rust = DockFill_Rust(
-                self, self.rust_versions, self.cargo_install
-            )
-        else:
-            self.dockfill_rust = None
-        self.strategies = [
-            x
-            for x in [
-                dfd,  # first create/ensure the basic docker image --> run
-                self.dockfill_rust,  # then comes rust, this creates a container via _run_docker --> that just installs rust outside the container
-                # dfp,  # this calls anysnake.build ... ehich also calls _run_docker
-                # Dockfill_PythonPoetry(self, dfp),
-                # DockFill_CodeVenv(
-                #    self, dfp, dfgv
-                # ),  # since I want them earlier in the path!
-                # dfgv,
-            ]
-            if x is not None
-        ]
-        dfr = None
-        if r_version:
-            self.R_version = r_version
-            dfr = DockFill_R(self)
-        else:
-            if self.bioconductor_version:
-                self.R_version = DockFill_Bioconductor.find_r_from_bioconductor(self)
-                dfr = DockFill_R(self)
-            else:
-                self.R_version = None
-        if self.R_version is not None and self.R_version < "3.0":
-            raise ValueError("Requested an R version that is not rpy2 compatible")
-
-        if dfr:
-            self.strategies.append(dfr)
-            self.strategies.append(DockFill_Rpy2(self, dfp, dfr))
-            if self.bioconductor_version:
-                self.strategies.append(DockFill_Bioconductor(self, dfr))
-
-        self.strategies.append(DockFill_Clone(self))
+        self.r_version = r_version
+        self.environment_variables = dict(environment_variables)
+        # the other strategies are only created when needed (see create_strategies)
+        # so that e.g. docker_tag does not search storage paths or hit the network
+        self._strategies = {}
+        # container id -> container, so an interrupt can stop them (see _run_docker)
+        self._running_containers = {}
+        self._running_containers_lock = threading.Lock()
+        self.R_version = None  # decided when DockFill_R is created
         for k, v in self.paths.items():
             self.paths[k] = Path(v)
-        self.environment_variables = dict(environment_variables)
-        for df in self.strategies:
-            if hasattr(df, "env"):
-                self.environment_variables.update(df.env)
 
         if docker_image.endswith(":%md5sum%"):
             docker_image = docker_image[: docker_image.rfind(":")]
@@ -169,6 +184,143 @@ class Anysnake:
         self.docker_image = str(docker_image)
         self.mode = "unknown"
 
+    @property
+    def strategies(self):
+        return self.create_strategies()
+
+    def get_strategy_classes(self):
+        """The DockFill classes create_strategies will use -
+        without creating them"""
+        result = [DockFill_Docker]
+        if self.rust_versions:
+            result.append(DockFill_Rust)
+        result.extend(
+            [
+                DockFill_Python,
+                Dockfill_PythonPoetry,
+                DockFill_CodeVenv,
+                DockFill_GlobalVenv,
+            ]
+        )
+        if self.r_version or self.bioconductor_version:
+            result.extend([DockFill_R, DockFill_Rpy2])
+            if self.bioconductor_version:
+                result.append(DockFill_Bioconductor)
+        result.append(DockFill_Clone)
+        return result
+
+    def get_additional_docker_build_cmds(self):
+        return "".join(
+            cls.get_additional_docker_build_cmds(self)
+            for cls in self.get_strategy_classes()
+            if hasattr(cls, "get_additional_docker_build_cmds")
+        )
+
+    def get_strategy_dependencies(self):
+        """class -> the classes its strategy depends on - without creating
+        any strategy. This is the only declaration - get_strategy sets each
+        strategy's .dependencies from it. DockFill_Rust only counts if configured.
+        """
+        classes = self.get_strategy_classes()
+        dependencies = {
+            DockFill_Docker: [],
+            DockFill_Rust: [DockFill_Docker],
+            DockFill_Python: [DockFill_Docker],
+            Dockfill_PythonPoetry: [DockFill_Python],
+            # copy_bins_from_global needs the filled global venv
+            DockFill_CodeVenv: [
+                DockFill_Python,
+                DockFill_GlobalVenv,
+                Dockfill_PythonPoetry,
+                DockFill_Rust,
+            ],
+            DockFill_GlobalVenv: [
+                DockFill_Python,
+                Dockfill_PythonPoetry,
+                DockFill_Rust,
+            ],
+            DockFill_R: [DockFill_Docker],
+            DockFill_Rpy2: [DockFill_Python, DockFill_R],
+            # the install script runs in a virtualenv of our python,
+            # mounts the global venv and needs cargo for some packages
+            DockFill_Bioconductor: [
+                DockFill_R,
+                DockFill_Python,
+                DockFill_GlobalVenv,
+                DockFill_Rust,
+            ],
+            DockFill_Clone: [],  # plain clones outside of docker
+        }
+        return {cls: [x for x in dependencies[cls] if x in classes] for cls in classes}
+
+    def create_strategies(self, classes=None):
+        """Create the DockFill strategies for classes (default: all of them),
+        and the ones they depend on - once.
+        This finds their storage paths, and for bioconductor, the matching R version.
+
+        Returned in get_strategy_classes order, which is the PATH/volume order -
+        the build order is defined by each strategy's dependencies.
+        """
+        if classes is None:
+            classes = self.get_strategy_classes()
+        return [
+            self.get_strategy(cls)
+            for cls in self.get_strategy_classes()
+            if cls in classes
+        ]
+
+    def get_strategy(self, cls):
+        if cls not in self._strategies:
+            strategy = self._create_strategy(cls)
+            strategy.dependencies = [
+                self.get_strategy(x) for x in self.get_strategy_dependencies()[cls]
+            ]
+            self._strategies[cls] = strategy
+            for k, v in self.paths.items():
+                self.paths[k] = Path(v)
+        return self._strategies[cls]
+
+    @property
+    def dockfill_rust(self):
+        return self.get_strategy(DockFill_Rust) if self.rust_versions else None
+
+    def _create_strategy(self, cls):
+        if cls is DockFill_Docker:
+            return self.dockfill_docker
+        elif cls is DockFill_Rust:
+            # this creates a container via _run_docker
+            # --> that just installs rust outside the container
+            return DockFill_Rust(self, self.rust_versions, self.cargo_install)
+        elif cls is DockFill_Python:
+            return DockFill_Python(self)
+        elif cls is Dockfill_PythonPoetry:
+            return Dockfill_PythonPoetry(self, self.get_strategy(DockFill_Python))
+        elif cls is DockFill_GlobalVenv:
+            return DockFill_GlobalVenv(self, self.get_strategy(DockFill_Python))
+        elif cls is DockFill_CodeVenv:
+            return DockFill_CodeVenv(
+                self,
+                self.get_strategy(DockFill_Python),
+                self.get_strategy(DockFill_GlobalVenv),
+            )
+        elif cls is DockFill_R:
+            if self.r_version:
+                self.R_version = self.r_version
+            else:
+                self.R_version = DockFill_Bioconductor.find_r_from_bioconductor(self)
+            if self.R_version < "3.0":
+                raise ValueError("Requested an R version that is not rpy2 compatible")
+            return DockFill_R(self)
+        elif cls is DockFill_Rpy2:
+            return DockFill_Rpy2(
+                self, self.get_strategy(DockFill_Python), self.get_strategy(DockFill_R)
+            )
+        elif cls is DockFill_Bioconductor:
+            return DockFill_Bioconductor(self, self.get_strategy(DockFill_R))
+        elif cls is DockFill_Clone:
+            return DockFill_Clone(self)
+        raise ValueError(f"Unknown strategy class {cls}")
+
     def pprint(self):
         print("Anysnake")
         print(f"  Storage path: {self.paths['storage']}")
@@ -182,24 +334,54 @@ class Anysnake:
         # Todo: cran
         # todo: modularize into dockerfills
 
-    def ensure(self, do_time=False):
+    def ensure(self, do_time=False, full_check=False):
+        """Make sure everything is build.
+
+        Strategies whose inputs and outputs are unchanged since the last
+        ensure (see StateManifest) are skipped unless full_check is set.
+        """
+        manifest = StateManifest(self.paths["ensure_manifest"], self)
+        if full_check:
+            to_run = self.strategies
+        else:
+            # decided on the configuration alone - no strategy gets created
+            stale = manifest.find_stale(self.get_strategy_dependencies())
+            if not stale:
+                return
+            # but all of them are needed to run the stale ones -
+            # their constructors register paths the others read (e.g. rpy2)
+            to_run = [s for s in self.strategies if s.__class__ in stale]
         self.paths["storage"].mkdir(parents=True, exist_ok=True)
         self.paths["code"].mkdir(parents=False, exist_ok=True)
 
         self.paths["log_storage"].mkdir(parents=False, exist_ok=True)
         self.paths["log_code"].mkdir(parents=False, exist_ok=True)
 
-        run_post_build = False
-        print(self.strategies)
-        for s in self.strategies:
-            print("=======================")
-            print(s)
-            print("=======================")
-            start = time.time()
-            run_post_build |= s.ensure()
-            if do_time:
-                print(s.__class__.__name__, time.time() - start)
-        raise ValueError()
+        print(to_run)
+        # version checks of all strategies at once, not one network roundtrip each
+        self.version_index.prefetch(
+            [url for s in to_run for url in getattr(s, "version_index_urls", [])]
+        )
+        for s in to_run:
+            manifest.forget(s)
+        try:
+            with tracing.span("ensure", strategies=len(to_run)):
+                run_post_build = run_strategies(
+                    to_run,
+                    self.parallel_builds,
+                    do_time=do_time,
+                    on_done=manifest.record,
+                    on_interrupt=self.kill_running_containers,
+                )
+        finally:
+            manifest.save()
+        if self.wheelhouse and self.paths["storage_wheelhouse"].exists():
+            removed = wheelhouse_module.evict(
+                self.paths["storage_wheelhouse"],
+                wheelhouse_module.parse_size(self.wheelhouse_size),
+            )
+            if removed:
+                print(f"wheelhouse: evicted {removed / 1024 ** 2:.0f} MB")
         if run_post_build and self.post_build_cmd:
             import subprocess
 
@@ -210,9 +392,7 @@ class Anysnake:
             p.communicate()
 
     def ensure_just_docker(self):
-        for s in self.strategies:
-            if isinstance(s, DockFill_Docker):
-                s.ensure()
+        self.dockfill_docker.ensure()
 
     def rebuild(self):
         for s in self.strategies:
@@ -225,52 +405,47 @@ class Anysnake:
         for k in self.environment_variables.keys():
             # don't use update here - won't work with the toml object
             env[k] = self.environment_variables[k]
+        for df in self.strategies:
+            if hasattr(df, "env"):
+                env.update(df.env)
         env["ANYSNAKE_PROJECT_PATH"] = Path(".").absolute()
         env["ANYSNAKE_USER"] = self.get_login_username()
         env["ANYSNAKE_MODE"] = self.mode
         env["ANYSNAKE_PORTS"] = json.dumps(ports)
         return env
 
-    def _build_cmd(
+    def get_run_script(self, bash_script):
+        """The bash script with PATH etc. set up for running inside the container"""
+        path_str = (
+            ":".join(
+                [x.shell_path for x in self.strategies if hasattr(x, "shell_path")]
+            )
+            + ":$PATH"
+        )
+        return (
+            f"export PATH={path_str}\n"
+            + "umask 0002\n"  # allow sharing by default
+            # + "source /anysnake/code_venv/bin/activate\n"
+            + bash_script
+        )
+
+    def get_docker_run_args(
         self,
-        bash_script,
+        run_script_filename,
         env={},
         ports={},
         py_spy_support=True,
-        home_files={},
-        home_dirs={},
         volumes_ro={},
         volumes_rw={},
         allow_writes=False,
     ):
-        """
-        ports is merged with those defined in the config/object creation
-        """
+        """docker run arguments (volumes, environment, ports...)
+        for running run_script_filename as /anysnake/run.sh"""
         env = self.get_environment_variables(env, ports)
-
-        # docker-py has no concept of interactive dockers
-        # dockerpty does not work with current docker-py
-        # so we use the command line interface...
-
-        tf = tempfile.NamedTemporaryFile(mode="w")
-        path_str = (
-            ":".join(
-                [x.shell_path for x in self.strategies if hasattr(x, "shell_path")]
-            )
-            + ":$PATH"
-        )
-        tf.write(f"export PATH={path_str}\n")
-        tf.write(f"umask 0002\n")  # allow sharing by default
-        # tf.write("source /anysnake/code_venv/bin/activate\n")
-        tf.write(bash_script)
-        print("bash script running inside:\n", bash_script)
-        print("")
-        tf.flush()
-
         home_inside_docker = self.paths["home_inside_docker"]
         ro_volumes = [
             {
-                "/anysnake/run.sh": tf.name,
+                "/anysnake/run.sh": str(run_script_filename),
                 "/etc/passwd": "/etc/passwd",  # the users inside are the users outside
                 "/etc/group": "/etc/group",
                 # "/etc/shadow": "/etc/shadow",
@@ -310,7 +485,7 @@ class Anysnake:
         ro_volumes.append(volumes_ro)
         rw_volumes.append(volumes_rw)
         volumes = combine_volumes(ro=ro_volumes, rw=rw_volumes)
-        cmd = ["docker", "run", "-it", "--rm"]
+        cmd = []
         for inside_path, (outside_path, mode) in sorted(
             volumes.items(), key=lambda x: str(x[1])
         ):
@@ -340,6 +515,45 @@ class Anysnake:
 
         cmd.extend(["--workdir", "/project"])
         cmd.append("--network=bridge")
+        return cmd
+
+    def _build_cmd(
+        self,
+        bash_script,
+        env={},
+        ports={},
+        py_spy_support=True,
+        home_files={},
+        home_dirs={},
+        volumes_ro={},
+        volumes_rw={},
+        allow_writes=False,
+    ):
+        """
+        ports is merged with those defined in the config/object creation
+        """
+        # docker-py has no concept of interactive dockers
+        # dockerpty does not work with current docker-py
+        # so we use the command line interface...
+
+        tf = tempfile.NamedTemporaryFile(mode="w")
+        tf.write(self.get_run_script(bash_script))
+        print("bash script running inside:\n", bash_script)
+        print("")
+        tf.flush()
+
+        cmd = ["docker", "run", "-it", "--rm"]
+        cmd.extend(
+            self.get_docker_run_args(
+                tf.name,
+                env=env,
+                ports=ports,
+                py_spy_support=py_spy_support,
+                volumes_ro=volumes_ro,
+                volumes_rw=volumes_rw,
+                allow_writes=allow_writes,
+            )
+        )
         cmd.extend(
             [
                 self.docker_image,
@@ -365,9 +579,16 @@ class Anysnake:
         return cmd, tf
 
     def run(self, *args, **kwargs):
+        """Returns the exit code"""
         cmd, tf = self._build_cmd(*args, **kwargs)
         p = subprocess.Popen(cmd)
         p.communicate()
+        return p.returncode
+
+    def run_warm(self, *args, idle_timeout=1800, **kwargs):
+        """run inside the project's long lived container (via docker exec).
+        Returns the exit code"""
+        return WarmContainer(self, idle_timeout).run(*args, **kwargs)
 
     def run_non_interactive(self, *args, **kwargs):
         cmd, tf = self._build_cmd(*args, **kwargs)
@@ -380,6 +601,8 @@ class Anysnake:
         print("_______run_docker_________")
         print(bash_script)
         print(run_kwargs)
+        from docker import from_env as docker_from_env
+
         docker_image = self.docker_image
         client = docker_from_env()
         tf = tempfile.NamedTemporaryFile(mode="w")
@@ -395,6 +618,19 @@ class Anysnake:
             Path("~").expanduser(): self.paths["home_inside_docker"],
         }
         volumes.update(run_kwargs["volumes"])
+        environment = {}
+        if self.compiler_cache:
+            self.paths["storage_ccache"].mkdir(exist_ok=True, parents=True)
+            volumes[compiler_cache.docker_path] = self.paths["storage_ccache"]
+            environment.update(compiler_cache.get_environment(self.compiler_cache_size))
+        if self.wheelhouse:
+            (self.paths["storage_wheelhouse"] / "wheels").mkdir(
+                exist_ok=True, parents=True
+            )
+            volumes[wheelhouse_module.docker_path] = self.paths["storage_wheelhouse"]
+            environment.update(wheelhouse_module.get_environment())
+        environment.update(run_kwargs.get("environment") or {})
+        run_kwargs["environment"] = environment
         volume_args = {}
         for k, v in volumes.items():
             k = str(Path(k).absolute())
@@ -407,6 +643,8 @@ class Anysnake:
         # if not root and not "user" in run_kwargs:
         # run_kwargs["user"] = "%s:%i" % (self.get_login_username(), os.getgid())
         tf.write(f"umask 0002\n")  # allow sharing by default
+        if self.compiler_cache:
+            tf.write(compiler_cache.get_script_header())
         tf.write(bash_script)
         tf.flush()
         print("-------image----------")
@@ -416,43 +654,74 @@ class Anysnake:
         print("-------cmd script----------")
         print(bash_script)
         print(self.get_login_username())
-        container = client.containers.create(
-            docker_image,
-            (
-                ["/bin/bash", "/anysnake/run.sh"]
-                if root
-                else [
-                    "/anysnake/gosu",
-                    self.get_login_username(),
-                    "/bin/bash",
-                    "/anysnake/run.sh",
-                ]
-            ),
-            **run_kwargs,
-        )
-        container_result = b""
-        try:
-            return_code = -1
-            container.start()
-            gen = container.logs(stdout=True, stderr=True, stream=True)
-            for piece in gen:
-                container_result += piece
-                print(piece.decode("utf-8"), end="")
-                sys.stdout.flush()
-            return_code = container.wait()
-        except KeyboardInterrupt:
-            container.kill()
-
-        if hasattr(log_name, "write"):
-            log_name.write(container_result)
-        elif log_name:
-            if append_to_log:
-                with open(str(self.paths[log_name]), "ab") as op:
-                    op.write(container_result)
-            else:
-                self.paths[log_name].write_bytes(container_result)
-        print(return_code, container_result)
-        return return_code, container_result
+        if hasattr(log_name, "write") or not log_name:
+            log_file = log_name
+            trace_name = "docker"
+        else:
+            log_file = self.paths[log_name]
+            trace_name = "docker " + log_name
+        with tracing.span(trace_name + " create"):
+            container = client.containers.create(
+                docker_image,
+                (
+                    ["/bin/bash", "/anysnake/run.sh"]
+                    if root
+                    else [
+                        "/anysnake/gosu",
+                        self.get_login_username(),
+                        "/bin/bash",
+                        "/anysnake/run.sh",
+                    ]
+                ),
+                **run_kwargs,
+            )
+        sink = LogSink(log_file, append=append_to_log, verbosity=self.console_verbosity)
+        return_code = -1
+        with self._running_containers_lock:
+            self._running_containers[container.id] = container
+        with tracing.span(trace_name + " run") as trace_args:
+            try:
+                with tracing.span(trace_name + " start"):
+                    container.start()
+                gen = container.logs(stdout=True, stderr=True, stream=True)
+                for piece in gen:
+                    if not sink.total_size:
+                        tracing.instant(trace_name + " first output")
+                    sink.write(piece)
+                with tracing.span(trace_name + " exit"):
+                    return_code = container.wait()
+            except KeyboardInterrupt:
+                container.kill()
+            finally:
+                with self._running_containers_lock:
+                    del self._running_containers[container.id]
+                sink.close(failed=not is_success(return_code))
+                trace_args["return_code"] = str(return_code)
+                trace_args["output_bytes"] = sink.total_size
+        tail = sink.get_tail()
+        if self.compiler_cache:
+            stats = compiler_cache.get_build_stats(tail)
+            if stats is not None:
+                print(trace_name, compiler_cache.format_stats(stats))
+                tracing.instant(trace_name + " ccache", **stats)
+        print(return_code)
+        return return_code, tail
+
+    def kill_running_containers(self):
+        """Kill the containers _run_docker is waiting on.
+
+        Ctrl-C is only delivered to the main thread, the strategies
+        run_strategies executes in worker threads would never see it."""
+        from docker.errors import APIError
+
+        with self._running_containers_lock:
+            containers = list(self._running_containers.values())
+        for container in containers:
+            print("killing container", container.name)
+            try:
+                container.kill()
+            except APIError:  # already gone
+                pass
 
     def build(
         self,
@@ -466,20 +735,68 @@ class Anysnake:
         additional_volumes=None,
         version_check=None,
         root=False,
+        cache=True,
     ):
         """Build a target_dir (into temp, rename on success),
         returns True if it was build, False if it was already present
+
+        If cache is set, identical builds (same build_cmds, docker image,
+        environment and inputs) are taken from the host wide build cache instead.
+        Don't cache builds that are modified in place later on (e.g. venvs).
         """
         target_dir = target_dir.absolute()
         print(target_dir)
         if not target_dir.exists():
-            if version_check is not None:
-                version_check()
-            print("Building", log_name[4:])
-            build_dir = target_dir.with_name(target_dir.name + "_temp")
-            if build_dir.exists():
-                shutil.rmtree(str(build_dir))
-            build_dir.mkdir(parents=True)
+            with tracing.span("build " + log_name, target_dir=str(target_dir)) as args:
+                args["cached"] = not self._build(
+                    target_dir,
+                    target_dir_inside_docker,
+                    relative_check_filename,
+                    log_name,
+                    build_cmds,
+                    environment,
+                    additional_volumes,
+                    version_check,
+                    root,
+                    cache,
+                )
+            return True
+        else:
+            return False
+
+    def _build(
+        self,
+        target_dir,
+        target_dir_inside_docker,
+        relative_check_filename,
+        log_name,
+        build_cmds,
+        environment,
+        additional_volumes,
+        version_check,
+        root,
+        cache,
+    ):
+        """The part of build() that happens if target_dir does not exist.
+        Returns False if we could use a cached build"""
+        cache_key = None
+        if cache:
+            cache_key = self.build_cache.get_key(
+                build_cmds,
+                self.docker_image,
+                environment,
+                additional_volumes,
+                target_dir_inside_docker,
+                relative_check_filename,
+                root,
+            )
+            if self.build_cache.place(cache_key, target_dir):
+                return False
+        if version_check is not None:
+            version_check()
+        print("Building", log_name[4:])
+        build_dir = make_temp_dir(target_dir)
+        try:
             volumes = {target_dir_inside_docker: build_dir}
             if additional_volumes:
                 volumes.update(additional_volumes)
@@ -499,16 +816,25 @@ class Anysnake:
                 if Path("logs").exists():
                     pass  # written in _run_docker
                 else:
-                    print("container stdout/stderr", container_result)
+                    print("container stdout/stderr (tail)", container_result[1])
                 raise ValueError(
                     "Docker build failed. Investigate " + str(self.paths[log_name])
                 )
-            else:
-                # un-atomic copy (across device borders!), atomic rename -> safe
+            if cache_key:
+                (build_dir / key_filename).write_text(cache_key)
+            # un-atomic copy (across device borders!), atomic rename -> safe
+            try:
                 build_dir.rename(target_dir)
-            return True
-        else:
-            return False
+            except OSError:
+                if not target_dir.exists():
+                    raise
+                return True  # another process finished the same build first
+        finally:
+            if build_dir.exists():  # failed, or built concurrently
+                shutil.rmtree(str(build_dir), ignore_errors=True)
+        if cache_key:
+            self.build_cache.store(cache_key, target_dir)
+        return True
 
     @property
     def major_python_version(self):
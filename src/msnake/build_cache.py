@@ -0,0 +1,125 @@
+# -*- coding: future_fstrings -*-
+"""Content addressed cache of Anysnake.build results - per user
+(~/.anysnake/build_cache) by default, shared with build_cache_path.
+
+An entry is keyed by a hash over everything that goes into a build -
+build_cmds, docker image, environment, and the mounted inputs.
+Inputs that are build results themselves are identified by their
+build key (stored in key_filename inside each build), so e.g. rpy2
+is shared between projects that use the same python & R builds,
+no matter where their storage_path is.
+
+Entries are copied in and out (reflinked where the file system supports it) -
+never hardlinked, since the storage copies get modified in place later on
+(pip/R installing into them), and that must not change the cached entry.
+"""
+import hashlib
+import json
+import shutil
+import subprocess
+import uuid
+from pathlib import Path
+
+key_filename = "anysnake.build_key"
+
+
+def read_build_key(path):
+    """The build key of a previous (cached) build in path, or None"""
+    try:
+        return (Path(path) / key_filename).read_text().strip()
+    except OSError:
+        return None
+
+
+def copy_tree(source, target):
+    """Copy the contents of source into the (existing) directory target -
+    reflinking where possible"""
+    subprocess.check_call(
+        ["cp", "-a", "--reflink=auto", str(source) + "/.", str(target)]
+    )
+
+
+def make_temp_dir(path):
+    """A unique directory next to path - concurrent builds must not share it.
+    Unlike mkdtemp's, it honors the umask, it may become path"""
+    path.parent.mkdir(exist_ok=True, parents=True)
+    temp_dir = path.with_name(f"{path.name}_temp_{uuid.uuid4().hex}")
+    temp_dir.mkdir()
+    return temp_dir
+
+
+class BuildCache:
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def get_key(
+        self,
+        build_cmds,
+        docker_image,
+        environment,
+        volumes,
+        target_dir_inside_docker,
+        relative_check_filename,
+        root,
+    ):
+        """volumes: inside -> outside path or (outside, mode)"""
+        inputs = {}
+        for inside, outside in (volumes or {}).items():
+            if isinstance(outside, tuple):
+                outside = outside[0]
+            key = read_build_key(outside)
+            inputs[str(inside)] = key if key else str(Path(outside).absolute())
+        description = {
+            "build_cmds": build_cmds,
+            "docker_image": docker_image,
+            "environment": environment or {},
+            "inputs": inputs,
+            "target": str(target_dir_inside_docker),
+            "check": str(relative_check_filename),
+            "root": bool(root),
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def get_entry_path(self, key):
+        return self.path / key[:2] / key
+
+    def has(self, key):
+        return read_build_key(self.get_entry_path(key)) == key
+
+    def place(self, key, target_dir):
+        """Copy the cached build into target_dir (which must not exist).
+        Returns True on success"""
+        if not self.has(key):
+            return False
+        target_dir = Path(target_dir)
+        print("Using cached build", key, "for", target_dir)
+        temp_dir = make_temp_dir(target_dir)
+        try:
+            copy_tree(self.get_entry_path(key), temp_dir)
+            temp_dir.rename(target_dir)
+        except (OSError, subprocess.CalledProcessError):
+            shutil.rmtree(str(temp_dir), ignore_errors=True)
+            if read_build_key(target_dir) != key:  # not placed concurrently
+                raise
+        return True
+
+    def store(self, key, build_dir):
+        """Add a finished build to the cache.
+        Never raises - the cache is an optimization only"""
+        entry = self.get_entry_path(key)
+        if self.has(key):
+            return
+        temp_dir = None
+        try:
+            temp_dir = make_temp_dir(entry)
+            copy_tree(build_dir, temp_dir)
+            if entry.exists():  # incomplete entry
+                shutil.rmtree(str(entry))
+            temp_dir.rename(entry)
+        except (OSError, subprocess.CalledProcessError) as e:
+            if temp_dir is not None:
+                shutil.rmtree(str(temp_dir), ignore_errors=True)
+            if not self.has(key):  # and not stored concurrently
+                print("Could not add build to build cache", self.path, e)
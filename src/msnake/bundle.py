@@ -0,0 +1,178 @@
+# -*- coding: future_fstrings -*-
+"""Export / import prebuild storage components (python, R, rpy2, bioconductor,
+global venvs) as zstd compressed tar archives plus a manifest.json.
+
+Bringing up a new machine then is a matter of unpacking instead of compiling.
+"""
+import hashlib
+import json
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# component name -> anysnake.paths key
+components = {
+    "python": "storage_python",
+    "R": "storage_r",
+    "rpy2": "storage_rpy2",
+    "bioconductor": "storage_bioconductor",
+    "venv": "storage_venv",
+    "poetry_venv": "poetry_venv",
+}
+
+manifest_filename = "manifest.json"
+
+
+def check_zstd():
+    if not shutil.which("zstd"):
+        raise ValueError("zstd not found - please install it (apt-get install zstd)")
+
+
+def storage_postfix(anysnake, path):
+    """The path of a component relative to its storage_path/docker_image,
+    (e.g. python/3.7.2), even if it is from another machine's storage"""
+    path = Path(path)
+    try:
+        return str(path.relative_to(anysnake.paths["storage"]))
+    except ValueError:
+        docker_image_dir = anysnake.paths["storage"].name
+        parts = path.parts
+        if docker_image_dir in parts:
+            index = len(parts) - 1 - parts[::-1].index(docker_image_dir)
+            return str(Path(*parts[index + 1 :]))
+        raise ValueError(f"{path} is not within a storage path")
+
+
+def sha256_file(filename):
+    h = hashlib.sha256()
+    with open(str(filename), "rb") as op:
+        for block in iter(lambda: op.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def export_component(source_dir, archive, threads):
+    """tar | zstd -T source_dir into archive"""
+    temp = Path(str(archive) + "_temp")
+    tar = subprocess.Popen(
+        ["tar", "-C", str(source_dir.parent), "-cf", "-", source_dir.name],
+        stdout=subprocess.PIPE,
+    )
+    zstd = subprocess.Popen(
+        ["zstd", "-q", f"-T{threads}", "-f", "-o", str(temp)], stdin=tar.stdout
+    )
+    tar.stdout.close()  # so tar get's a SIGPIPE if zstd dies
+    zstd.communicate()
+    tar.wait()
+    if tar.returncode != 0 or zstd.returncode != 0:
+        if temp.exists():
+            temp.unlink()
+        raise ValueError(f"Packing {source_dir} failed")
+    temp.rename(archive)
+    return sha256_file(archive)
+
+
+def import_component(archive, target_dir, sha256):
+    """zstd -d | tar into target_dir (via a temp dir, renamed on success)"""
+    if sha256_file(archive) != sha256:
+        raise ValueError(f"Checksum mismatch on {archive}")
+    temp_dir = target_dir.with_name(target_dir.name + "_import_temp")
+    if temp_dir.exists():
+        shutil.rmtree(str(temp_dir))
+    temp_dir.mkdir(parents=True)
+    zstd = subprocess.Popen(
+        ["zstd", "-q", "-d", "-c", str(archive)], stdout=subprocess.PIPE
+    )
+    tar = subprocess.Popen(["tar", "-C", str(temp_dir), "-xf", "-"], stdin=zstd.stdout)
+    zstd.stdout.close()
+    tar.communicate()
+    zstd.wait()
+    unpacked = list(temp_dir.iterdir())
+    if tar.returncode != 0 or zstd.returncode != 0 or len(unpacked) != 1:
+        shutil.rmtree(str(temp_dir))
+        raise ValueError(f"Unpacking {archive} failed")
+    unpacked[0].rename(target_dir)
+    temp_dir.rmdir()
+
+
+def export_storage(anysnake, output_dir, wanted=None, jobs=4):
+    """Pack all (or the wanted) built components into output_dir"""
+    check_zstd()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True, parents=True)
+    anysnake.create_strategies()  # they define the storage paths
+    todo = {}
+    for name, key in components.items():
+        if wanted and name not in wanted:
+            continue
+        if key in anysnake.paths and anysnake.paths[key].exists():
+            todo[name] = anysnake.paths[key]
+        elif wanted:
+            raise ValueError(f"{name} has not been build - nothing to export")
+    if not todo:
+        raise ValueError("Nothing to export - run msnake build first")
+    threads = max(1, anysnake.cores // min(jobs, len(todo)))
+    manifest = {"docker_image": anysnake.docker_image, "components": {}}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for name, path in todo.items():
+            archive = output_dir / f"{name}.tar.zst"
+            print("packing", name, path)
+            futures[name] = (
+                pool.submit(export_component, path, archive, threads),
+                archive,
+                path,
+            )
+        for name, (future, archive, path) in futures.items():
+            manifest["components"][name] = {
+                "archive": archive.name,
+                "postfix": storage_postfix(anysnake, path),
+                "sha256": future.result(),
+                "size": archive.stat().st_size,
+            }
+    (output_dir / manifest_filename).write_text(
+        json.dumps(manifest, indent=2, sort_keys=True)
+    )
+    print("exported", ", ".join(sorted(todo)), "to", output_dir)
+    return manifest
+
+
+def import_storage(anysnake, bundle_dir, jobs=4):
+    """Unpack the components of a bundle that this project needs
+    and that are not present yet"""
+    check_zstd()
+    bundle_dir = Path(bundle_dir)
+    anysnake.create_strategies()
+    manifest = json.loads((bundle_dir / manifest_filename).read_text())
+    if manifest["docker_image"] != anysnake.docker_image:
+        print(
+            f"Warning: bundle was build with {manifest['docker_image']}, "
+            f"we are using {anysnake.docker_image}"
+        )
+    todo = {}
+    for name, info in manifest["components"].items():
+        key = components[name]
+        if key not in anysnake.paths:
+            print("skipping", name, "- not used by this project")
+            continue
+        target = anysnake.paths[key]
+        if target.exists():
+            print("skipping", name, "- already present in", target)
+            continue
+        wanted_postfix = storage_postfix(anysnake, target)
+        if wanted_postfix != info["postfix"]:
+            print(
+                f"skipping {name} - bundle has {info['postfix']}, need {wanted_postfix}"
+            )
+            continue
+        target.parent.mkdir(exist_ok=True, parents=True)
+        todo[name] = (bundle_dir / info["archive"], target, info["sha256"])
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            name: pool.submit(import_component, *args) for (name, args) in todo.items()
+        }
+        for name, future in futures.items():
+            future.result()
+            print("imported", name, "to", todo[name][1])
+    return sorted(todo)
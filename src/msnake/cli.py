@@ -2,12 +2,13 @@
 import os
 import tempfile
 import click
-import click_completion
 
-click_completion.init()
+if os.environ.get("_MSNAKE_COMPLETE"):  # only needed when completing
+    import click_completion
+
+    click_completion.init()
 
 from pathlib import Path
-from mbf_anysnake import parse_requirements, parsed_to_anysnake
 import subprocess
 from .util import get_next_free_port
 
@@ -31,8 +32,9 @@ def main():
 
 
 def get_anysnake():
-    parsed = parse_requirements(config_file)
-    return parsed_to_anysnake(parsed), parsed
+    from .config_cache import load_anysnake
+
+    return load_anysnake(config_file)
 
 
 def get_volumes_config(config, key2):
@@ -51,12 +53,30 @@ def get_volumes_config(config, key2):
 
 @main.command()
 @click.option("--do-time", default=False, is_flag=True)
-def build(do_time=False):
+@click.option(
+    "--trace",
+    default=None,
+    help="write a chrome trace (chrome://tracing, ui.perfetto.dev) json to this file",
+)
+def build(do_time=False, trace=None):
     """Build everything if necessary - from docker to local venv from project.setup 
     Outputs full docker_image:tag
+
+    Unlike the implicit build of run/shell/..., this always checks every part,
+    even if nothing changed since the last build.
     """
+    from . import tracing
+
+    if trace:
+        tracing.tracer.enable()
     d, _ = get_anysnake()
-    d.ensure(do_time)
+    try:
+        d.ensure(do_time, full_check=True)
+    finally:
+        if trace:
+            tracing.tracer.write_chrome_trace(trace)
+            print(tracing.tracer.summary())
+            print("trace written to", trace)
     print(d.docker_image)
     return d
 
@@ -78,8 +98,10 @@ def remove_pip(packages):
     If they're editable, remove their code/folders as well"""
     import shutil
     import tomlkit
+    from .dockfill_python import safe_name, DockFill_CodeVenv
 
     d, config = get_anysnake()
+    d.create_strategies()  # for code_clones / code_venv paths
     local_config = tomlkit.loads(Path("anysnake.toml").read_text())
     write_toml = False
     for p in packages:
@@ -96,9 +118,18 @@ def remove_pip(packages):
             / ("python" + d.major_python_version)
             / "site-packages"
         )
-        print(p + "*")
-        for f in lib_path.glob(p + "*"):
-            print(f)
+        code_venv = [s for s in d.strategies if isinstance(s, DockFill_CodeVenv)][0]
+        installed = {
+            safe_name(name): info
+            for (name, info) in code_venv.find_installed_distributions(
+                d.major_python_version
+            ).items()
+        }
+        if safe_name(p) in installed:
+            info = installed[safe_name(p)]
+            print(p, info["version"])
+            for f in [info["info"]] + info["top_level"]:
+                print(lib_path / f)
 
     if write_toml:
         import time
@@ -160,10 +191,16 @@ def shell(no_build=False, allow_writes=False, include_perf=False):
 @click.option("--no-build/--build", default=False)
 @click.option("--pre/--no-pre", default=True, help="run pre_run_inside/outside")
 @click.option("--post/--no-post", default=True, help="run post_run_inside/outside")
+@click.option(
+    "--warm/--no-warm",
+    default=None,
+    help="run inside a long lived project container (default: [run] warm_container)",
+)
 @click.argument("cmd", nargs=-1)
-def run(cmd, no_build=False, pre=True, post=True):
+def run(cmd, no_build=False, pre=True, post=True, warm=None):
     """Run a command"""
     import subprocess
+    import sys
 
     d, config = get_anysnake()
     print(d)
@@ -188,18 +225,26 @@ def run(cmd, no_build=False, pre=True, post=True):
     d.mode = "run"
     print(cmd)
     print("------------------")
-    print(
-        d.run(
+    run_kwargs = dict(
+        allow_writes=False,
+        home_files=home_files,
+        home_dirs=home_dirs,
+        volumes_ro=get_volumes_config(config, "additional_volumes_ro"),
+        volumes_rw=get_volumes_config(config, "additional_volumes_rw"),
+    )
+    if warm is None:
+        warm = config.get("run", {}).get("warm_container", False)
+    if warm:
+        return_code = d.run_warm(
             cmd,
-            allow_writes=False,
-            home_files=home_files,
-            home_dirs=home_dirs,
-            volumes_ro=get_volumes_config(config, "additional_volumes_ro"),
-            volumes_rw=get_volumes_config(config, "additional_volumes_rw"),
+            idle_timeout=config.get("run", {}).get("warm_container_idle_timeout", 1800),
+            **run_kwargs,
         )
-    )
+    else:
+        return_code = d.run(cmd, **run_kwargs)
     if post and post_run_outside:
         subprocess.Popen(post_run_outside, shell=True).communicate()
+    sys.exit(return_code)
 
 
 def check_if_nb_extensions_are_activated():
@@ -373,6 +418,7 @@ def show_config():
 def show_paths():
     """Print the config as it is actually used"""
     d, parsed = get_anysnake()
+    d.create_strategies()  # they add their paths
     import pprint
 
     print("paths detected")
@@ -428,6 +474,9 @@ code_path="code"
 # include rust (if you use bioconductor, rust 1.30.0 will be added automatically)
 # rust = ["1.30.0", "nigthly-2019-03-20"]
 
+# how many independent parts (python, R, rust...) may be build at the same time
+# parallel_builds = 4
+
 [run]
 # additional folders to map into docker
 additional_volumes_ro = [['/opt', '/opt']]
@@ -441,6 +490,9 @@ pre_run_inside = \"""
 \"""
 post_run_inside = "echo 'bash script running inside container after run cmd'"
 post_run_outside = "echo 'bash script running outside container after run cmd'"
+# keep one container per project running and 'docker exec' run commands in it
+# warm_container = true
+# warm_container_idle_timeout = 1800 # seconds
 
 # python packages installed into global storage
 [global_python]
@@ -500,11 +552,72 @@ def freeze():
     print(tomlkit.dumps(output))
 
 
+@main.command()
+@click.argument("output_dir")
+@click.option(
+    "-c",
+    "--component",
+    multiple=True,
+    help="python, R, rpy2, bioconductor, venv, poetry_venv (default: all build ones)",
+)
+@click.option("-j", "--jobs", default=4, help="components to compress in parallel")
+def export(output_dir, component, jobs):
+    """Export the build storage components as zstd archives into output_dir,
+    for msnake import on another machine"""
+    from .bundle import export_storage
+
+    d, parsed = get_anysnake()
+    export_storage(d, output_dir, component, jobs)
+
+
+@main.command(name="import")
+@click.argument("bundle_dir")
+@click.option("-j", "--jobs", default=4, help="components to unpack in parallel")
+def import_(bundle_dir, jobs):
+    """Import storage components from an msnake export
+    (those that are not already present)"""
+    from .bundle import import_storage
+
+    d, parsed = get_anysnake()
+    import_storage(d, bundle_dir, jobs)
+
+
+@main.command()
+@click.option(
+    "-i",
+    "--installer",
+    multiple=True,
+    help="poetry, pip, uv (default: all of them)",
+)
+@click.option(
+    "--venv",
+    type=click.Choice(["code", "storage"]),
+    default="code",
+    help="whose packages to install - the local (code) or the global (storage) venv",
+)
+def benchmark_installers(installer, venv):
+    """Install the packages of a venv into a fresh venv with each
+    venv_installer and report the time each took"""
+    from .dockfill_python import DockFill_CodeVenv, DockFill_GlobalVenv
+    from .installer import installers
+
+    d, parsed = get_anysnake()
+    d.ensure()
+    wanted = DockFill_CodeVenv if venv == "code" else DockFill_GlobalVenv
+    fill = [s for s in d.strategies if isinstance(s, wanted)][0]
+    results = fill.benchmark_installers(installer if installer else sorted(installers))
+    for name, (runtime, success) in sorted(results.items(), key=lambda x: x[1][0]):
+        print(
+            "%-10s %8.1fs %s"
+            % (name, runtime, "" if success else "(failed - see logs)")
+        )
+
+
 @main.command()
 def version():
-    import mbf_anysnake
+    import msnake
 
-    print("mbf_anysnake version %s" % mbf_anysnake.__version__)
+    print("msnake version %s" % getattr(msnake, "__version__", "unknown"))
 
 
 @main.command()
@@ -514,12 +627,15 @@ def version():
 @click.argument(
     "shell",
     required=False,
-    type=click_completion.DocumentedChoice(click_completion.core.shells),
+    type=click.Choice(["bash", "fish", "zsh", "powershell"]),
 )
 def show_completion(shell, case_insensitive):
     """Show the click-completion-command completion code
     ie. what you need to add to your shell configuration.
     """
+    import click_completion
+
+    click_completion.init()
     extra_env = (
         {"_CLICK_COMPLETION_COMMAND_CASE_INSENSITIVE_COMPLETE": "ON"}
         if case_insensitive
@@ -0,0 +1,109 @@
+# -*- coding: future_fstrings -*-
+"""ccache (and sccache for rust) for everything compiled inside build containers.
+
+The cache lives in storage/ccache (it's per docker image, so per compiler
+version) and is mounted into every _run_docker container.
+Putting /usr/lib/ccache first in the PATH is enough for python-build,
+R's configure and R CMD INSTALL (R's Makeconf just says 'gcc').
+
+ccache -s is recorded before and printed after each build script,
+and the difference reported as the build's hit rate. Builds running
+in parallel share the cache, so their statistics may include each
+others' compiles.
+"""
+import re
+
+docker_path = "/anysnake/ccache"
+stats_before_marker = "### anysnake ccache stats before"
+stats_after_marker = "### anysnake ccache stats after"
+
+
+def get_environment(max_size):
+    return {
+        "CCACHE_DIR": docker_path,
+        "CCACHE_MAXSIZE": str(max_size),
+        # builds run as root and as the users of the storage group - group
+        # writable like the rest of the storage, but not world writable:
+        # anybody could poison the other users' objects otherwise
+        "CCACHE_UMASK": "002",
+        # python / R build in temp dirs with differing names
+        "CCACHE_BASEDIR": "/",
+        "CCACHE_NOHASHDIR": "1",
+        "SCCACHE_DIR": docker_path + "/sccache",
+    }
+
+
+def get_script_header():
+    """bash code to prepend to a build script"""
+    return f"""
+if [ -d /usr/lib/ccache ] && command -v ccache >/dev/null; then
+    export PATH=/usr/lib/ccache:$PATH
+    ANYSNAKE_CCACHE_BEFORE=$(ccache -s)
+    # both at the end, so they are in the tail of the output
+    trap 'echo "{stats_before_marker}"; echo "$ANYSNAKE_CCACHE_BEFORE"; echo "{stats_after_marker}"; ccache -s' EXIT
+fi
+if command -v sccache >/dev/null || [ -x /anysnake/cargo/bin/sccache ]; then
+    export RUSTC_WRAPPER=$(command -v sccache || echo /anysnake/cargo/bin/sccache)
+fi
+"""
+
+
+def parse_stats(text):
+    """hits / misses from ccache -s output (ccache 3.x and 4.x)"""
+    hits = 0
+    misses = 0
+    found = False
+    for line in text.split("\n"):
+        line = line.strip()
+        m = re.match(r"^cache hit \((direct|preprocessed)\)\s+(\d+)", line)  # 3.x
+        if m:
+            hits += int(m.group(2))
+            found = True
+            continue
+        m = re.match(r"^cache miss\s+(\d+)", line)
+        if m:
+            misses += int(m.group(1))
+            found = True
+            continue
+        m = re.match(r"^Hits:\s+(\d+)", line)  # 4.x
+        if m:
+            hits += int(m.group(1))
+            found = True
+            continue
+        m = re.match(r"^Misses:\s+(\d+)", line)
+        if m:
+            misses += int(m.group(1))
+            found = True
+    if not found:
+        return None
+    return {"hits": hits, "misses": misses}
+
+
+def get_build_stats(output):
+    """The ccache hits/misses of one build, from its (tail of) output,
+    or None if the stats were not found"""
+    if isinstance(output, bytes):
+        output = output.decode("utf-8", errors="replace")
+    before_pos = output.rfind(stats_before_marker)
+    after_pos = output.rfind(stats_after_marker)
+    if before_pos == -1 or after_pos < before_pos:
+        return None
+    before = parse_stats(output[before_pos:after_pos])
+    after = parse_stats(output[after_pos:])
+    if before is None or after is None:
+        return None
+    return {
+        "hits": max(0, after["hits"] - before["hits"]),
+        "misses": max(0, after["misses"] - before["misses"]),
+    }
+
+
+def format_stats(stats):
+    total = stats["hits"] + stats["misses"]
+    if not total:
+        return "ccache: nothing compiled"
+    return "ccache: %i hits, %i misses (%.1f%% hit rate)" % (
+        stats["hits"],
+        stats["misses"],
+        100.0 * stats["hits"] / total,
+    )
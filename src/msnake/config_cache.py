@@ -0,0 +1,138 @@
+# -*- coding: future_fstrings -*-
+"""Cache the parsed configuration and the Anysnake object build from it.
+
+Parsing anysnake.toml (and the global_config), resolving environment
+variables, and constructing all DockFill strategies (which hashes the
+Dockerfile for the docker tag) happens on every msnake command.
+We pickle the result to ~/.anysnake/config_cache and reuse it as long as
+
+    - the used_files, the docker image build scripts and msnake itself
+      have the same mtime & size,
+    - every environment variable referenced as ${NAME} in the used_files
+      (and HOME/USER) has the same value,
+    - every path in anysnake.paths still exists (or still does not exist) -
+      storage_per_hostname picks storage paths by existence,
+    - we are on the same host with the same cpu count -
+      ~/.anysnake may be shared, and Anysnake.cores is the machine's.
+"""
+import hashlib
+import os
+import pickle
+import re
+import socket
+from collections.abc import Mapping
+from pathlib import Path
+
+cache_version = 1
+re_env_var = re.compile(r"\$\{([^}]+)\}")
+
+
+def to_plain(value):
+    """tomlkit document -> plain python dicts/lists/strs/numbers,
+    which pickle (and compare) reliably"""
+    if isinstance(value, Mapping):
+        return {str(k): to_plain(v) for (k, v) in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [to_plain(x) for x in value]
+    elif isinstance(value, bool):
+        return bool(value)
+    elif isinstance(value, int):
+        return int(value)
+    elif isinstance(value, float):
+        return float(value)
+    elif isinstance(value, str):
+        return str(value)
+    return value
+
+
+def get_cache_filename(config_file):
+    config_file = str(Path(config_file).absolute())
+    return (
+        Path("~").expanduser()
+        / ".anysnake"
+        / "config_cache"
+        / (hashlib.md5(config_file.encode("utf-8")).hexdigest() + ".pickle")
+    )
+
+
+def stat_file(filename):
+    try:
+        s = os.stat(str(filename))
+    except OSError:
+        return None
+    return (s.st_mtime_ns, s.st_size)
+
+
+def get_watched_files(used_files):
+    result = [str(Path(x).absolute()) for x in used_files]
+    package_dir = Path(__file__).parent
+    result.extend(sorted(str(x) for x in package_dir.glob("*.py")))
+    docker_images = package_dir.parent.parent / "docker_images"
+    result.extend(sorted(str(x) for x in docker_images.glob("*/*")))
+    return result
+
+
+def get_referenced_env_vars(used_files):
+    names = set(["HOME", "USER"])
+    for fn in used_files:
+        try:
+            names.update(re_env_var.findall(Path(fn).read_text()))
+        except OSError:
+            pass
+    return sorted(names)
+
+
+def get_key(watched_files, env_var_names, paths):
+    return {
+        "cache_version": cache_version,
+        "cwd": str(Path(".").absolute()),
+        "hostname": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "files": {fn: stat_file(fn) for fn in watched_files},
+        "env": {name: os.environ.get(name) for name in env_var_names},
+        "paths": {str(p): Path(p).exists() for p in paths},
+    }
+
+
+def load_anysnake(config_file):
+    """parse_requirements + parsed_to_anysnake, cached.
+    Returns (anysnake, parsed)"""
+    from .parser import parse_requirements, parsed_to_anysnake
+
+    cache_filename = get_cache_filename(config_file)
+    try:
+        with open(str(cache_filename), "rb") as op:
+            cached = pickle.load(op)
+        if cached["key"] == get_key(
+            cached["watched_files"], cached["env_var_names"], cached["paths"]
+        ):
+            anysnake = cached["anysnake"]
+            # side effects of parsed_to_anysnake
+            Path("logs").mkdir(parents=False, exist_ok=True)
+            anysnake.paths["per_user"].mkdir(exist_ok=True)
+            return anysnake, cached["parsed"]
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError, AttributeError):
+        pass
+
+    parsed = to_plain(parse_requirements(config_file))
+    anysnake = parsed_to_anysnake(parsed)
+    watched_files = get_watched_files(parsed["used_files"])
+    env_var_names = get_referenced_env_vars(parsed["used_files"])
+    paths = sorted(set(str(x) for x in anysnake.paths.values()))
+    cached = {
+        "key": get_key(watched_files, env_var_names, paths),
+        "watched_files": watched_files,
+        "env_var_names": env_var_names,
+        "paths": paths,
+        "anysnake": anysnake,
+        "parsed": parsed,
+    }
+    try:
+        cache_filename.parent.mkdir(exist_ok=True, parents=True)
+        temp = cache_filename.with_name(cache_filename.name + ".%i" % os.getpid())
+        with open(str(temp), "wb") as op:
+            pickle.dump(cached, op, pickle.HIGHEST_PROTOCOL)
+        temp.rename(cache_filename)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+        print("Could not cache configuration", e)
+    return anysnake, parsed
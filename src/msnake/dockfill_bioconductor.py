@@ -1,9 +1,11 @@
 # *- coding: future_fstrings -*-
 
-import requests
 from pathlib import Path
 import re
 from .util import find_storage_path_from_other_machine, download_file
+from . import tracing
+
+release_announcements_url = "https://bioconductor.org/about/release-announcements/"
 
 
 class DockFill_Bioconductor:
@@ -35,6 +37,9 @@ class DockFill_Bioconductor:
                 "docker_storage_bioconductor_download": (
                     str(Path("/anysnake/bioconductor_download"))
                 ),
+                # binary packages, shared between bioconductor versions
+                "r_package_cache": self.paths["build_cache"] / "r_packages",
+                "docker_r_package_cache": "/anysnake/r_package_cache",
                 "log_bioconductor": (
                     self.paths["log_storage"]
                     / f"anysnake.bioconductor.{self.bioconductor_version}.log"
@@ -68,11 +73,29 @@ class DockFill_Bioconductor:
         print(f"  Bioconductor version={self.bioconductor_version}")
 
     @staticmethod
-    def fetch_bioconductor_release_information():
+    def get_fingerprint(anysnake):
+        return {
+            "bioconductor_version": anysnake.bioconductor_version,
+            "bioconductor_whitelist": anysnake.bioconductor_whitelist,
+            "cran_mode": anysnake.cran_mode,
+            "r_package_cache": anysnake.r_package_cache,
+            "storage_per_hostname": anysnake.storage_per_hostname,
+        }
+
+    def get_artifacts(self):
+        return [
+            self.paths["storage_bioconductor"] / "done.sentinel",
+            self.paths["project_bioconductor"],
+        ]
+
+    @staticmethod
+    def fetch_bioconductor_release_information(anysnake):
         import maya
 
-        url = "https://bioconductor.org/about/release-announcements/"
-        bc = requests.get(url).text
+        url = release_announcements_url
+        bc = anysnake.version_index.get(url)
+        if bc is None:
+            raise ValueError(f"Could not fetch {url} (and no cached copy)")
         tbody = bc[
             bc.find("<tbody>") : bc.find("</tbody>")
         ]  # at least for now it's the first table on the page
@@ -138,15 +161,17 @@ class DockFill_Bioconductor:
         cache_file = anysnake.paths["storage_bioconductor_release_info"]
         if not cache_file.exists():
             cache_file.parent.mkdir(exist_ok=True, parents=True)
-            all_info = cls.fetch_bioconductor_release_information()
+            all_info = cls.fetch_bioconductor_release_information(anysnake)
             if not anysnake.bioconductor_version in all_info:
                 raise ValueError(
                     f"Could not find bioconductor {anysnake.bioconductor_version} - check https://bioconductor.org/about/release-announcements/"
                 )
             info = all_info[anysnake.bioconductor_version]
             major = info["r_major_version"]
-            url = anysnake.cran_mirror + "src/base/R-" + major[0]
-            r = requests.get(url).text
+            url = anysnake.cran_mirror + "src/base/R-" + major[0] + "/"
+            r = anysnake.version_index.get(url)
+            if r is None:
+                raise ValueError(f"Could not fetch {url} (and no cached copy)")
             available = re.findall("R-(" + major + r"\.\d+).tar.gz", r)
             matching = [x for x in available if x.startswith(major)]
             by_minor = [(re.findall(r"\d+.\d+.(\d+)", x), x) for x in matching]
@@ -208,9 +233,20 @@ echo `which cargo`
 python  {self.paths['docker_storage_bioconductor']}/_inside_dockfill_bioconductor.py
 """
             env = {"URL_%s" % k.upper(): v for (k, v) in urls.items()}
+            trace_file = self.paths["storage_bioconductor"] / "trace.jsonl"
+            if tracing.tracer.enabled:
+                env["ANYSNAKE_TRACE"] = "1"
+                if trace_file.exists():
+                    trace_file.unlink()
             env["BIOCONDUCTOR_VERSION"] = self.bioconductor_version
             env["BIOCONDUCTOR_WHITELIST"] = ":".join(self.bioconductor_whitelist)
             env["CRAN_MODE"] = self.cran_mode
+            env["COMPILE_THREADS"] = str(self.anysnake.cores)
+            if self.anysnake.r_package_cache:
+                self.paths["r_package_cache"].mkdir(exist_ok=True, parents=True)
+                env["R_PACKAGE_CACHE"] = self.paths["docker_r_package_cache"]
+                env["DOCKER_IMAGE"] = self.anysnake.docker_image
+                env["R_VERSION"] = self.anysnake.R_version
             env[
                 "RUSTUP_TOOLCHAIN"
             ] = "1.30.0"  # Todo: combine with the one in parser.py
@@ -230,6 +266,10 @@ python  {self.paths['docker_storage_bioconductor']}/_inside_dockfill_bioconducto
                 self.paths["docker_storage_rustup"]: self.paths["storage_rustup"],
                 self.paths["docker_storage_cargo"]: self.paths["storage_cargo"],
             }
+            if self.anysnake.r_package_cache:
+                volumes[self.paths["docker_r_package_cache"]] = self.paths[
+                    "r_package_cache"
+                ]
             print("calling bioconductor install docker")
             self.anysnake._run_docker(
                 bash_script,
@@ -237,6 +277,7 @@ python  {self.paths['docker_storage_bioconductor']}/_inside_dockfill_bioconducto
                 "log_bioconductor",
                 root=True,
             )
+            tracing.tracer.import_jsonl(trace_file, "bioconductor pipegraph")
             if not self.is_done(self.paths["storage_bioconductor"]):
                 print(
                     f"bioconductor install failed, check {self.paths['log_bioconductor']}"
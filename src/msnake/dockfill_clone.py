@@ -1,4 +1,4 @@
-from .util import clone_repo
+from .util import clone_repos
 
 
 class DockFill_Clone:
@@ -20,8 +20,6 @@ class DockFill_Clone:
             anysnake.paths["docker_storage_clones"]: anysnake.paths["storage_clones"],
             anysnake.paths["docker_code_clones"]: anysnake.paths["code_clones"],
         }
-        self.paths['storage_clones'].mkdir(exist_ok=True)
-        self.paths['code_clones'].mkdir(exist_ok=True)
 
     def pprint(self):
         print("  Global cloned repos")
@@ -31,18 +29,50 @@ class DockFill_Clone:
         for entry in self.anysnake.local_clones.items():
             print("    {}".format(entry))
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {
+            "global_clones": anysnake.global_clones,
+            "local_clones": anysnake.local_clones,
+            "clone_options": anysnake.clone_options,
+            "clone_mirrors": anysnake.clone_mirror_path is not None,
+        }
+
+    def get_artifacts(self):
+        return [
+            self.paths["storage_clones"] / name for name in self.anysnake.global_clones
+        ] + [self.paths["code_clones"] / name for name in self.anysnake.local_clones]
+
     def ensure(self):
-        cloned = False
-        with (self.paths["storage_clones"] / "log.txt").open("w") as log_file:
-            for name, source in self.anysnake.global_clones.items():
-                cloned |= self.clone(name, source, self.paths["storage_clones"], log_file)
-        with (self.paths["code_clones"] / "log.txt").open("w") as log_file:
-            for name, source in self.anysnake.local_clones.items():
-                cloned |= self.clone(name, source, self.paths["code_clones"], log_file)
-        return cloned
-
-    def clone(self, name, source, target_path, log_file):
-        if not (target_path / name).exists():
-            clone_repo(source, name, target_path / name, log_file)
-            return True
-        return False
+        self.paths["storage_clones"].mkdir(exist_ok=True)
+        self.paths["code_clones"].mkdir(exist_ok=True)
+        todo = []
+        for clones, target_path, log_path in [
+            (
+                self.anysnake.global_clones,
+                self.paths["storage_clones"],
+                self.paths["log_storage"],
+            ),
+            (
+                self.anysnake.local_clones,
+                self.paths["code_clones"],
+                self.paths["log_code"],
+            ),
+        ]:
+            for name, source in clones.items():
+                if not (target_path / name).exists():
+                    todo.append(
+                        (
+                            name,
+                            source,
+                            target_path / name,
+                            log_path / f"anysnake.clone.{name}.log",
+                        )
+                    )
+        clone_repos(
+            todo,
+            self.anysnake.clone_jobs,
+            self.anysnake.clone_options,
+            self.anysnake.clone_mirror_path,
+        )
+        return bool(todo)
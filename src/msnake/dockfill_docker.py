@@ -2,7 +2,6 @@
 
 from pathlib import Path
 import subprocess
-import docker
 import tempfile
 import shutil
 import os
@@ -38,9 +37,7 @@ class DockFill_Docker:
         b = (
             self.paths["docker_image_build_scripts"] / docker_image_name / "Dockerfile"
         ).read_text()
-        for s in self.anysnake.strategies:
-            if hasattr(s, "get_additional_docker_build_cmds"):
-                b += s.get_additional_docker_build_cmds()
+        b += self.anysnake.get_additional_docker_build_cmds()
         b += "\n" + self.docker_build_cmds + "\n"
         return b
 
@@ -52,6 +49,8 @@ class DockFill_Docker:
         # if not it divines the docker image name and checks ckecks if a build script is already present. If so it reads a preexisting template dockerfile and runs it
         # if not, it tries to pull the image from docker hub ...
         # I assume the Dockerfile template was done by hand
+        import docker
+
         client = docker.from_env()
         tags_available = set()
         for img in client.images.list():
@@ -90,6 +89,33 @@ class DockFill_Docker:
     def pprint(self):
         print(f"  docker_image = {self.anysnake.docker_image}")
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {
+            "docker_image": anysnake.docker_image,
+            "docker_build_cmds": anysnake.docker_build_cmds,
+        }
+
+    def get_artifacts(self):
+        return []  # the image lives in the docker daemon - see is_present
+
+    @staticmethod
+    def is_present(anysnake):
+        """Does the local docker daemon have the image?
+        The ensure manifest is in the (possibly shared) storage,
+        the image might have been removed, or never been build on this host."""
+        try:
+            return (
+                subprocess.call(
+                    ["docker", "image", "inspect", anysnake.docker_image],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                == 0
+            )
+        except OSError:
+            return False
+
     def get_dockerfile_hash(self, docker_image_name):
         import hashlib
 
@@ -1,20 +1,24 @@
 # -*- coding: future_fstrings -*-
-import requests
 import tempfile
+import hashlib
 import re
 import os
+import json
+import shlex
 import subprocess
-import packaging.version
-import pkg_resources
 from pathlib import Path
+from . import wheelhouse
+from . import installed_index
+from .installer import get_installer
 from .util import (
     combine_volumes,
     find_storage_path_from_other_machine,
+    is_success,
     dict_to_toml,
-    clone_repo,
+    clone_repos,
     re_github,
+    sync_files,
 )
-import tomlkit
 
 
 class DockFill_Python:
@@ -38,9 +42,11 @@ class DockFill_Python:
         self.volumes = {
             anysnake.paths["docker_storage_python"]: anysnake.paths["storage_python"]
         }
+        self.version_index_urls = ["https://www.python.org/doc/versions/"]
 
-    def get_additional_docker_build_cmds(self):
-        if self.python_version.startswith("2"):
+    @staticmethod
+    def get_additional_docker_build_cmds(anysnake):
+        if anysnake.python_version.startswith("2"):
             # python beyond these versions needs libssl 1.1
             # the older ones need libssl1.0
             # on older debians/ubuntus that would be libssl-dev
@@ -84,11 +90,24 @@ echo "done"
 """,
         )
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {
+            "python_version": anysnake.python_version,
+            "storage_per_hostname": anysnake.storage_per_hostname,
+        }
+
+    def get_artifacts(self):
+        return [self.paths["storage_python"] / "bin" / "virtualenv"]
+
     def check_python_version_exists(self):
         version = self.python_version
-        r = requests.get("https://www.python.org/doc/versions/").text
+        r = self.anysnake.version_index.get(self.version_index_urls[0])
+        if r is None:
+            print("python.org unreachable and no cached version list - not checking")
+            return
         if not (
-            f'release/{version}/"' in r or f'release/{version}"'
+            f'release/{version}/"' in r or f'release/{version}"' in r
         ):  # some have / some don't
             raise ValueError(
                 f"Unknown python version {version} - check https://www.python.org/doc/versions/"
@@ -99,7 +118,47 @@ echo "done"
 
 
 def safe_name(name):
-    return pkg_resources.safe_name(name).lower()
+    # pkg_resources.safe_name, without the (slow) pkg_resources import
+    return re.sub("[^A-Za-z0-9.]+", "-", name).lower()
+
+
+def poetry_to_pep440(spec):
+    """Translate a poetry version constraint into a PEP 440 specifier string
+    ('' for any version). Returns None for things pip can't express
+    (urls, 'or' constraints...)"""
+    spec = spec.strip()
+    if spec in ("", "*"):
+        return ""
+    if spec.startswith("@") or "||" in spec or "|" in spec:
+        return None
+    result = []
+    for part in spec.split(","):
+        part = part.strip()
+        m = re.match(r"^(\^|~(?!=))?\s*(\d+(\.\d+)*)(\.\*)?$", part)
+        if m:
+            op, version, _, wildcard = m.groups()
+            numbers = [int(x) for x in version.split(".")]
+            if wildcard:
+                result.append(f"=={version}.*")
+            elif not op:  # a bare version is an exact pin in poetry
+                result.append(f"=={version}")
+            elif op == "~":
+                # ~1.2.3 -> >=1.2.3,<1.3, ~1 -> >=1,<2
+                upper = numbers[:2] if len(numbers) > 1 else numbers[:1]
+                upper[-1] += 1
+                result.append(f">={version},<{'.'.join(str(x) for x in upper)}")
+            else:  # ^1.2.3 -> >=1.2.3,<2, ^0.2.3 -> >=0.2.3,<0.3
+                index = 0
+                while index < len(numbers) - 1 and numbers[index] == 0:
+                    index += 1
+                upper = numbers[: index + 1]
+                upper[-1] += 1
+                result.append(f">={version},<{'.'.join(str(x) for x in upper)}")
+        elif re.match(r"^(===|==|!=|<=|>=|<|>|~=)\s*[A-Za-z0-9_.*+!-]+$", part):
+            result.append(part.replace(" ", ""))
+        else:
+            return None
+    return ",".join(result)
 
 
 class _Dockfill_Venv_Base:
@@ -113,6 +172,7 @@ class _Dockfill_Venv_Base:
             relative_check_filename=Path("bin") / "activate.fish",
             log_name=f"log_{self.name}_venv",
             additional_volumes=self.dockfill_python.volumes,
+            cache=False,  # venvs get filled in place
             build_cmds=f"""
 {self.paths['docker_storage_python']}/bin/virtualenv -p {self.paths['docker_storage_python']}/bin/python {self.target_path_inside_docker}
 {additional_cmd}
@@ -134,6 +194,8 @@ class Dockfill_PythonPoetry(_Dockfill_Venv_Base):
                     self.paths["storage"] / "poetry_venv" / self.python_version
                 ),
                 "docker_poetry_venv": "/anysnake/poetry_venv",
+                "storage_poetry_locks": self.paths["storage"] / "poetry_locks",
+                "docker_poetry_locks": "/anysnake/poetry_locks",
                 "log_python_poetry_venv": self.paths["log_storage"]
                 / f"anysnake.poetry_venv.{self.python_version}.log",
             }
@@ -145,6 +207,13 @@ class Dockfill_PythonPoetry(_Dockfill_Venv_Base):
     def pprint(self):
         pass
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {"python_version": anysnake.python_version}
+
+    def get_artifacts(self):
+        return [self.target_path / "bin" / "poetry"]
+
     def ensure(self):
         res = self.create_venv()
         res |= self.install_poetry()
@@ -200,16 +269,41 @@ class _DockerFillVenv(_Dockfill_Venv_Base):
         self.poetry_path = self.clone_path / f"poetry_{self.anysnake.python_version}"
         self.poetry_path.mkdir(exist_ok=True, parents=True)
         self.poetry_path_inside_docker = str(
-            Path(self.clone_path_inside_docker) / f"poetry_{self.anysnake.python_version}"
+            Path(self.clone_path_inside_docker)
+            / f"poetry_{self.anysnake.python_version}"
         )
+        # what we installed last time - for delta installs
+        self.delta_state_filename = self.poetry_path / "anysnake_installed.json"
 
     def ensure(self):
         res = self.create_venv()
         res |= self.fill_venv()
         return res
 
-    def fill_venv(self, rebuild=False):
-        code_packages = {
+    @staticmethod
+    def get_venv_fingerprint(anysnake, packages):
+        return {
+            "python_version": anysnake.python_version,
+            "packages": packages,
+            "venv_installer": anysnake.venv_installer,
+            # editable packages are cloned
+            "clone_options": anysnake.clone_options,
+            "clone_mirrors": anysnake.clone_mirror_path is not None,
+        }
+
+    def get_artifacts(self):
+        """site-packages changes whenever something get's (un)installed"""
+        return [
+            self.target_path
+            / "lib"
+            / ("python" + self.anysnake.major_python_version)
+            / "site-packages",
+            self.poetry_path / "pyproject.toml",
+        ]
+
+    def get_code_packages(self):
+        """The editable packages - name -> url"""
+        return {
             k: v
             for (k, v) in self.packages.items()
             if v.startswith("@git+")
@@ -217,12 +311,17 @@ class _DockerFillVenv(_Dockfill_Venv_Base):
             or v.startswith("@")
             and re.match(re_github, v[1:])  # github
         }
+
+    def fill_venv(self, rebuild=False):
+        code_packages = self.get_code_packages()
         code_names = set(code_packages.keys())
         any_cloned = self.clone_code_packages(code_packages)
-        if rebuild or any_cloned:
-            # force rebuild
+        if rebuild:
+            # force a full resolution
             if Path(self.poetry_path / "pyproject.toml").exists():
                 Path(self.poetry_path / "pyproject.toml").unlink()
+            if self.delta_state_filename.exists():
+                self.delta_state_filename.unlink()
         packages_missing = set([safe_name(x) for x in self.packages]) - set(
             [
                 safe_name(x)
@@ -232,22 +331,30 @@ class _DockerFillVenv(_Dockfill_Venv_Base):
             ]
         )
 
-        return self.install_with_poetry(self.packages, code_packages, packages_missing)
+        return self.install_with_poetry(
+            self.packages, code_packages, packages_missing, any_cloned
+        )
 
     def clone_code_packages(self, code_packages):
         result = set()
+        todo = []
         for name, url_spec in code_packages.items():
             log_key = f"log_{self.name}_venv_{name}"
             self.paths[log_key + "_clone"] = self.log_path / (
                 f"anysnake.{self.name}_venv_{name}.pip.log"
             )
             target_path = self.clone_path / name
-            with open(str(self.paths[log_key + "_clone"]), "wb") as log_file:
-                if not target_path.exists():
-                    result.add(name)
-                    url = url_spec
-                    clone_repo(url, name, target_path, log_file)
-
+            if not target_path.exists():
+                result.add(name)
+                todo.append(
+                    (name, url_spec, target_path, self.paths[log_key + "_clone"])
+                )
+        clone_repos(
+            todo,
+            self.anysnake.clone_jobs,
+            self.anysnake.clone_options,
+            self.anysnake.clone_mirror_path,
+        )
         return result
 
     def find_installed_packages(self, major_python_version):
@@ -266,35 +373,95 @@ class _DockerFillVenv(_Dockfill_Venv_Base):
                 pass
         return []
 
-    def find_installed_package_versions(self, major_python_version):
-        venv_dir = (
+    def find_installed_distributions(self, major_python_version):
+        """name -> {'version':, 'top_level': [modules], 'info': dist-info name}"""
+        site_packages = (
             self.target_path
             / "lib"
             / ("python" + major_python_version)
             / "site-packages"
         )
-        result = {}
-        for p in venv_dir.glob("*"):
-            if p.name.endswith(".dist-info"):
-                name = p.name[: p.name.rfind("-", 0, -5)]
-                version = p.name[p.name.rfind("-", 0, -5) + 1 : -1 * len(".dist-info")]
-                result[safe_name(name)] = version
-            elif p.name.endswith(".egg-link"):
-                name = p.name[: -1 * len(".egg-link")]
-                version = "unknown"
-                result[safe_name(name)] = version
-            elif p.name.endswith(".so"):
-                name = p.name[: p.name.find(".")]
-                version = "unknown"
-                result[safe_name(name)] = version
+        return installed_index.get_installed(
+            site_packages, self.target_path / "anysnake_installed_index.json"
+        )
 
-        return result
+    def find_installed_package_versions(self, major_python_version):
+        return {
+            safe_name(name): info["version"]
+            for (name, info) in self.find_installed_distributions(
+                major_python_version
+            ).items()
+        }
 
-    def install_with_poetry(self, packages, editable_packages, packages_missing):
-        """packages are parse_requirements results with method == 'pip'
-        we now use poetry for this
-        
+    def get_lock_key(self, toml, editable_packages):
+        """sha256 of what poetry resolves - the dependency section
+        of the pyproject.toml (not the project name) and the metadata
+        of the editable packages"""
+        h = hashlib.sha256()
+        h.update(toml[toml.index("[tool.poetry.dependencies]") :].encode("utf-8"))
+        for name in sorted(editable_packages):
+            for fn in ("setup.py", "setup.cfg", "pyproject.toml"):
+                path = self.clone_path / name / fn
+                if path.exists():
+                    h.update(f"{name}/{fn}\n".encode("utf-8"))
+                    h.update(path.read_bytes())
+        return h.hexdigest()
+
+    def plan_delta_install(self, packages, editable_packages, changed_editables):
+        """Compare the wanted packages with what we installed last time
+        and what is in the venv.
+
+        Returns (requirements to install, editable paths to install,
+        packages to uninstall),
+        or None if only a full poetry resolution will do
+        (first install, or constraints pip can't express)
         """
+        from packaging.specifiers import SpecifierSet, InvalidSpecifier
+        from packaging.version import Version, InvalidVersion
+
+        try:
+            previous = json.loads(self.delta_state_filename.read_text())
+        except (OSError, ValueError):
+            return None
+        installed = self.find_installed_package_versions(
+            self.anysnake.major_python_version
+        )
+        to_install = []
+        to_install_editable = []
+        for name, spec in sorted(packages.items()):
+            if name in editable_packages or safe_name(name) in editable_packages:
+                if (
+                    safe_name(name) not in installed
+                    or name in changed_editables
+                    or previous.get(name) != spec
+                ):
+                    extras = self.find_extras(name)
+                    path = f"{self.clone_path_inside_docker}/{name}"
+                    if extras:
+                        path += "[" + ",".join(extras) + "]"
+                    to_install_editable.append(path)
+                continue
+            pep440 = poetry_to_pep440(spec)
+            if pep440 is None:
+                return None
+            installed_version = installed.get(safe_name(name))
+            if installed_version is not None and previous.get(name) == spec:
+                continue
+            if installed_version is not None and installed_version != "unknown":
+                try:
+                    if Version(installed_version) in SpecifierSet(pep440):
+                        continue
+                except (InvalidVersion, InvalidSpecifier):
+                    pass
+            to_install.append(name + pep440)
+        to_remove = [
+            name
+            for name in sorted(previous)
+            if name not in packages and safe_name(name) in installed
+        ]
+        return to_install, to_install_editable, to_remove
+
+    def get_pyproject_toml(self, packages, editable_packages):
         toml = f"""
 [tool.poetry]
     name = "{self.anysnake.project_name}"
@@ -315,62 +482,132 @@ class _DockerFillVenv(_Dockfill_Venv_Base):
             else:
                 extras = [f'"{x}"' for x in self.find_extras(k)]
                 toml += f'\t{k} = {{path = "{self.clone_path_inside_docker}/{k}", extras = [{", ".join(extras)}]}}\n'
-        new_toml = toml
+        return toml
+
+    def get_requirements(self, packages, editable_packages):
+        """requirements.txt content for the pip / uv installers"""
+        lines = []
+        for k, v in sorted(packages.items()):
+            if k in editable_packages or safe_name(k) in editable_packages:
+                path = f"{self.clone_path_inside_docker}/{k}"
+                extras = self.find_extras(k)
+                if extras:
+                    path += "[" + ",".join(extras) + "]"
+                lines.append(f"-e {path}")
+            else:
+                pep440 = poetry_to_pep440(v)
+                if pep440 is None:
+                    raise ValueError(
+                        f"Can not express {k} = {v} for pip - "
+                        "use venv_installer = 'poetry'"
+                    )
+                lines.append(k + pep440)
+        return "\n".join(lines) + "\n"
+
+    def install_with_poetry(
+        self, packages, editable_packages, packages_missing, changed_editables=()
+    ):
+        """packages are parse_requirements results with method == 'pip'
+        we now use poetry (or the configured venv_installer) for this
+
+        If the resolved versions for this exact pyproject.toml have been stored
+        before (by any project using this storage), they're installed without
+        resolving.
+        Otherwise, if we have installed before, only the changed packages are
+        installed / removed with pip - and we fall back to a full
+        install if that leaves the venv inconsistent (pip check).
+        """
+        installer = get_installer(self.anysnake.venv_installer)
+        new_toml = self.get_pyproject_toml(packages, editable_packages)
         pyproject_toml = Path(self.poetry_path / "pyproject.toml")
         pyproject_toml.parent.mkdir(exist_ok=True)
         if pyproject_toml.exists():
             old_toml = pyproject_toml.read_text()
         else:
             old_toml = ""
-        if new_toml != old_toml or packages_missing:
-            print(f"poetry for {self.name} (slow, stand by)")
+        if new_toml != old_toml or packages_missing or changed_editables:
             import difflib
-            for row in (difflib.context_diff(old_toml.split("\n") ,new_toml.split("\n"))):
+
+            for row in difflib.context_diff(old_toml.split("\n"), new_toml.split("\n")):
                 print(row)
+            plan = self.plan_delta_install(
+                packages, editable_packages, changed_editables
+            )
+            if installer.needs_requirements:
+                (self.poetry_path / "requirements.txt").write_text(
+                    self.get_requirements(packages, editable_packages)
+                )
             pyproject_toml.write_text(new_toml)
+            tools_bin = f"{self.paths['docker_poetry_venv']}/bin"
+            lock_name = (
+                self.get_lock_key(new_toml, editable_packages) + installer.lock_suffix
+            )
+            stored_lock = self.paths["storage_poetry_locks"] / lock_name
+            full_install = installer.get_install_cmd(
+                self.poetry_path_inside_docker,
+                tools_bin,
+                f"{self.paths['docker_poetry_locks']}/{lock_name}",
+                stored_lock.exists(),
+            )
             cmd = [
                 f"source {self.target_path_inside_docker}/bin/activate",
-                f"cd {self.poetry_path_inside_docker} && {self.paths['docker_poetry_venv']}/bin/poetry update --verbose",
+                installer.get_setup_cmd(tools_bin),
             ]
-            cmd = "\n".join(cmd)
-            volumes_ro = self.dockfill_python.volumes.copy()
-            volumes_rw = {
-                self.target_path_inside_docker: self.target_path,
-                self.clone_path_inside_docker: self.clone_path,
-                self.paths["docker_poetry_venv"]: self.paths["poetry_venv"],
-            }
-            env = {}
-            paths = [self.target_path_inside_docker + "/bin"]
-            if self.anysnake.dockfill_rust is not None:  # if we have a rust, use it
-                volumes_ro.update(self.anysnake.dockfill_rust.volumes)
-                volumes_rw.update(self.anysnake.dockfill_rust.rw_volumes)
-                paths.append(self.anysnake.dockfill_rust.shell_path)
-                env.update(self.anysnake.dockfill_rust.env)
-            from .cli import home_files
-
-            home_inside_docker = self.anysnake.paths['home_inside_docker']
-            for h in home_files:
-                p = Path("~").expanduser() / h
-                if p.exists():
-                    volumes_ro[str(Path(home_inside_docker) / h)] = p
-
-            env["EXTPATH"] = ":".join(paths)
-            # /anysnake/code_venv/bin /anysnake/cargo/bin /anysnake/code_venv/bin /anysnake/storage_venv/bin /anysnake/R/bin /usr/local/sbin /usr/local/bin /usr/sbin /usr/bin /sbin /bin /machine/opt/infrastructure/client /machine/opt/infrastructure/repos/FloatingFileSystemClient
-            return_code, logs = self.anysnake._run_docker(
-                f"""
-    #!/bin/bash
-        export PATH=$PATH:$EXTPATH
-        echo "Path: $PATH"
-    {cmd}
-        echo "done"
-    
-        """,
-                {
-                    "volumes": combine_volumes(ro=volumes_ro, rw=volumes_rw),
-                    "environment": env,
-                },
-                f"log_{self.name}_venv_poetry",
-            )
+            if stored_lock.exists():
+                # pinned already - prebuild those, without resolving again
+                prebuild = installer.get_locked_requirements(stored_lock)
+            elif plan is None:
+                prebuild = [
+                    k + poetry_to_pep440(v)
+                    for (k, v) in packages.items()
+                    if k not in editable_packages
+                    and safe_name(k) not in editable_packages
+                    and poetry_to_pep440(v) is not None
+                ]
+            else:
+                prebuild = plan[0]
+            if self.anysnake.wheelhouse and installer.prebuild_wheels:
+                cmd.append(
+                    wheelhouse.get_prebuild_script(
+                        f"{self.target_path_inside_docker}/bin/pip",
+                        prebuild,
+                        max(1, self.anysnake.cores // 2),
+                        no_deps=stored_lock.exists(),
+                    )
+                )
+            if stored_lock.exists():
+                print(
+                    f"{installer.name} install for {self.name} from stored {lock_name}"
+                )
+                cmd.append(full_install)
+            elif plan is None:
+                print(f"{installer.name} for {self.name} (slow, stand by)")
+                cmd.append(full_install)
+            else:
+                to_install, to_install_editable, to_remove = plan
+                print(
+                    f"delta install for {self.name}: "
+                    f"{to_install + to_install_editable}, removing {to_remove}"
+                )
+                pip_args = list(to_install)
+                for path in to_install_editable:
+                    pip_args.extend(["-e", path])
+                delta_install = installer.get_delta_cmd(
+                    tools_bin,
+                    [shlex.quote(x) for x in pip_args],
+                    [shlex.quote(x) for x in to_remove],
+                )
+                cmd.append(
+                    f"""
+if {delta_install}; then
+    echo "delta install ok"
+else
+    echo "delta install left conflicts - falling back to a full install"
+    {full_install}
+fi
+"""
+                )
+            return_code, logs = self.run_install_script("\n".join(cmd))
             installed_now = self.find_installed_packages(
                 self.anysnake.major_python_version
             )
@@ -379,23 +616,129 @@ class _DockerFillVenv(_Dockfill_Venv_Base):
             )
             if still_missing:
                 msg = f"Installation of packages failed: {still_missing}\n"
-            elif (isinstance(return_code, int) and (return_code != 0)) or (
-                not isinstance(return_code, int) and (return_code["StatusCode"] != 0)
-            ):
+            elif not is_success(return_code):
                 msg = f"Installation of packages failed: return code was not 0 (was {return_code})\n"
             else:
                 msg = ""
             if msg:
-                print(self.paths[f"log_{self.name}_venv_poetry"].read_text())
+                if self.delta_state_filename.exists():
+                    self.delta_state_filename.unlink()
+                print(logs.decode("utf-8", errors="replace"))
                 raise ValueError(
                     msg
                     + "Check log in "
                     + str(self.paths[f"log_{self.name}_venv_poetry"])
                 )
+            self.delta_state_filename.write_text(
+                json.dumps({k: str(v) for (k, v) in packages.items()}, sort_keys=True)
+            )
             return True
         else:
             return False  # everything ok
 
+    def run_install_script(self, cmd, additional_volumes_rw={}, log_name=None):
+        """Run cmd in a container with the venv, the clones and the poetry venv"""
+        self.paths["storage_poetry_locks"].mkdir(exist_ok=True, parents=True)
+        volumes_ro = self.dockfill_python.volumes.copy()
+        volumes_rw = {
+            self.target_path_inside_docker: self.target_path,
+            self.clone_path_inside_docker: self.clone_path,
+            self.paths["docker_poetry_venv"]: self.paths["poetry_venv"],
+            self.paths["docker_poetry_locks"]: self.paths["storage_poetry_locks"],
+        }
+        volumes_rw.update(additional_volumes_rw)
+        env = {}
+        paths = [self.target_path_inside_docker + "/bin"]
+        if self.anysnake.dockfill_rust is not None:  # if we have a rust, use it
+            volumes_ro.update(self.anysnake.dockfill_rust.volumes)
+            volumes_rw.update(self.anysnake.dockfill_rust.rw_volumes)
+            paths.append(self.anysnake.dockfill_rust.shell_path)
+            env.update(self.anysnake.dockfill_rust.env)
+        from .cli import home_files
+
+        home_inside_docker = self.anysnake.paths["home_inside_docker"]
+        for h in home_files:
+            p = Path("~").expanduser() / h
+            if p.exists():
+                volumes_ro[str(Path(home_inside_docker) / h)] = p
+
+        env["EXTPATH"] = ":".join(paths)
+        # /anysnake/code_venv/bin /anysnake/cargo/bin /anysnake/code_venv/bin /anysnake/storage_venv/bin /anysnake/R/bin /usr/local/sbin /usr/local/bin /usr/sbin /usr/bin /sbin /bin /machine/opt/infrastructure/client /machine/opt/infrastructure/repos/FloatingFileSystemClient
+        return self.anysnake._run_docker(
+            f"""
+    #!/bin/bash
+        export PATH=$PATH:$EXTPATH
+        echo "Path: $PATH"
+    {cmd}
+        echo "done"
+    
+        """,
+            {
+                "volumes": combine_volumes(ro=volumes_ro, rw=volumes_rw),
+                "environment": env,
+            },
+            log_name if log_name else f"log_{self.name}_venv_poetry",
+        )
+
+    def benchmark_installers(self, installer_names):
+        """Install our packages into a fresh venv with each installer
+        (no stored locks, no delta installs) and time it.
+
+        Returns {installer name: (seconds, success)}"""
+        import shutil
+        import time
+
+        packages = self.packages
+        editable_packages = self.get_code_packages()
+        self.clone_code_packages(editable_packages)
+        benchmark_path = self.paths["storage"] / "installer_benchmark" / self.name
+        benchmark_path_inside_docker = "/anysnake/installer_benchmark"
+        venv_inside_docker = benchmark_path_inside_docker + "/venv"
+        python = f"{self.paths['docker_storage_python']}/bin/python"
+        results = {}
+        for name in installer_names:
+            installer = get_installer(name)
+            if benchmark_path.exists():
+                shutil.rmtree(str(benchmark_path))
+            benchmark_path.mkdir(parents=True)
+            (benchmark_path / "pyproject.toml").write_text(
+                self.get_pyproject_toml(packages, editable_packages)
+            )
+            (benchmark_path / "requirements.txt").write_text(
+                self.get_requirements(packages, editable_packages)
+            )
+            tools_bin = f"{self.paths['docker_poetry_venv']}/bin"
+            cmd = f"""
+{self.paths['docker_storage_python']}/bin/virtualenv -p {python} {venv_inside_docker} > /dev/null
+source {venv_inside_docker}/bin/activate
+{installer.get_setup_cmd(tools_bin)}
+echo "### anysnake benchmark start $(date +%s.%N)"
+{installer.get_install_cmd(benchmark_path_inside_docker, tools_bin, benchmark_path_inside_docker + "/lock", False)}
+anysnake_status=$?
+echo "### anysnake benchmark end $(date +%s.%N) $anysnake_status"
+"""
+            log_name = f"log_{self.name}_venv_benchmark_{name}"
+            self.paths[log_name] = self.log_path / (
+                f"anysnake.{self.name}_venv.benchmark_{name}.log"
+            )
+            print(f"benchmarking {name}")
+            start = time.time()
+            return_code, logs = self.run_install_script(
+                cmd, {benchmark_path_inside_docker: benchmark_path}, log_name
+            )
+            runtime = time.time() - start
+            times = re.findall(
+                rb"### anysnake benchmark (start|end) ([0-9.]+)(?: (\d+))?", logs
+            )
+            success = False
+            if len(times) == 2:  # just the install, without container startup
+                runtime = float(times[1][1]) - float(times[0][1])
+                success = times[1][2] == b"0"
+            results[name] = (runtime, success)
+        if benchmark_path.exists():
+            shutil.rmtree(str(benchmark_path))
+        return results
+
 
 class DockFill_GlobalVenv(_DockerFillVenv):
     def __init__(self, anysnake, dockfill_python):
@@ -426,6 +769,12 @@ class DockFill_GlobalVenv(_DockerFillVenv):
         self.shell_path = str(Path(self.paths["docker_storage_venv"]) / "bin")
         super().__init__()
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return _DockerFillVenv.get_venv_fingerprint(
+            anysnake, anysnake.global_python_packages
+        )
+
     def pprint(self):
         print("  Global python packages")
         for entry in self.anysnake.global_python_packages.items():
@@ -474,33 +823,35 @@ class DockFill_CodeVenv(_DockerFillVenv):
         self.fill_sitecustomize()
         return False
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return _DockerFillVenv.get_venv_fingerprint(
+            anysnake, anysnake.local_python_packages
+        )
+
+    def get_artifacts(self):
+        return super().get_artifacts() + [self.paths["storage_venv"] / "bin"]
+
     def copy_bins_from_global(self):
         source_dir = self.paths["storage_venv"] / "bin"
         target_dir = self.paths["code_venv"] / "bin"
-        for input_fn in source_dir.glob("*"):
-            if not input_fn.is_dir():
-                output_fn = target_dir / input_fn.name
-                if not output_fn.exists():
-                    input = input_fn.read_bytes()
-                    if input.startswith(b"#"):
-                        n_pos = input.find(b"\n")
-                        first_line = input[:n_pos]
-                        if (
-                            first_line
-                            == f"#!{self.paths['docker_storage_venv']}/bin/python".encode(
-                                "utf-8"
-                            )
-                        ):
-                            output = (
-                                f"#!{self.paths['docker_code_venv']}/bin/python".encode(
-                                    "utf-8"
-                                )
-                                + input[n_pos:]
-                            )
-                            output_fn.write_bytes(output)
-                    else:
-                        output_fn.write_bytes(input)
-                    output_fn.chmod(input_fn.stat().st_mode)
+        global_shebang = f"#!{self.paths['docker_storage_venv']}/bin/python".encode(
+            "utf-8"
+        )
+        code_shebang = f"#!{self.paths['docker_code_venv']}/bin/python".encode("utf-8")
+
+        def rewrite_shebang(input):
+            n_pos = input.find(b"\n")
+            if input.startswith(b"#") and input[:n_pos] == global_shebang:
+                return code_shebang + input[n_pos:]
+            return input
+
+        sync_files(
+            source_dir,
+            target_dir,
+            self.paths["code_venv"] / "anysnake_bins_from_global.json",
+            rewrite_shebang,
+        )
         pth_path = (
             self.paths["code_venv"]
             / "lib"
@@ -2,7 +2,6 @@
 
 import re
 from pathlib import Path
-import requests
 from .util import combine_volumes, find_storage_path_from_other_machine
 
 
@@ -27,17 +26,35 @@ class DockFill_R:
             self.paths["docker_storage_r"]: self.paths["storage_r"]
         }
         self.shell_path = str(Path(self.paths["docker_storage_r"]) / "bin")
+        self.version_index_urls = [
+            self.cran_mirror + "src/base/R-" + self.R_version[0] + "/"
+        ]
 
     def pprint(self):
         print(f"  R version={self.R_version}")
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        # the R version follows from the bioconductor version if not set
+        return {
+            "r_version": anysnake.r_version,
+            "bioconductor_version": anysnake.bioconductor_version,
+            "storage_per_hostname": anysnake.storage_per_hostname,
+        }
+
+    def get_artifacts(self):
+        return [self.paths["storage_r"] / "bin" / "R"]
+
     def check_r_version_exists(self):
         if not re.match(r"\d+\.\d+\.\d", self.R_version):
             raise ValueError(
                 "Incomplete R version specified - bust look like e.g 3.5.3"
             )
-        url = self.cran_mirror + "src/base/R-" + self.R_version[0]
-        r = requests.get(url).text
+        url = self.version_index_urls[0]
+        r = self.anysnake.version_index.get(url)
+        if r is None:
+            print(f"{url} unreachable and not cached - not checking R version")
+            return
         if not f"R-{self.R_version}.tar.gz" in r:
             raise ValueError(
                 (f"Unknown R version {self.R_version} - check {url} for list")
@@ -59,7 +76,7 @@ class DockFill_R:
             relative_check_filename="bin/R",
             log_name=f"log_r",
             additional_volumes={},
-            version_check=self.check_r_version_exists(),
+            version_check=self.check_r_version_exists,
             build_cmds=f"""
 cd ~
 wget {r_url} -O R.tar.gz
@@ -105,6 +122,17 @@ class DockFill_Rpy2:
     def pprint(self):
         pass
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {
+            "python_version": anysnake.python_version,
+            "r": DockFill_R.get_fingerprint(anysnake),
+            "rpy2_version": anysnake.rpy2_version,
+        }
+
+    def get_artifacts(self):
+        return [self.paths["storage_rpy2"] / "done"]
+
     def ensure(self):
         # TODO: This will probably need fine tuning for combining older Rs and the
         # latest rpy2 version that supported them
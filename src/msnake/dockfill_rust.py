@@ -86,7 +86,6 @@ class DockFill_Rust:
                 self.paths["docker_storage_rustup"]: self.paths["storage_rustup"],
                 self.paths["docker_storage_cargo"]: self.paths["storage_cargo"],
             }
-            raise ValueError()
             self.anysnake._run_docker(
                 cmd, {"volumes": volumes, "environment": env}, "log_rust", root=True
             )
@@ -98,6 +97,19 @@ class DockFill_Rust:
             return True
         return False
 
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {
+            "rust_versions": anysnake.rust_versions,
+            "cargo_install": anysnake.cargo_install,
+        }
+
+    def get_artifacts(self):
+        return [
+            self.paths["storage_rustup"] / "anysnake" / f"{v}.done"
+            for v in self.rust_versions
+        ]
+
     def get_installed_rust_versions(self):
         result = set()
         p = self.paths["storage_rustup"] / "anysnake"
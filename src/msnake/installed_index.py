@@ -0,0 +1,116 @@
+# -*- coding: future_fstrings -*-
+"""Index of the distributions installed in a site-packages directory.
+
+Names and versions come from the METADATA / PKG-INFO files,
+the top level modules from RECORD / top_level.txt.
+The index is stored next to the venv and reused as long as the
+site-packages directory's mtime is unchanged - every (un)install
+adds or renames a *.dist-info, which changes it.
+So a current index costs a single stat call.
+"""
+import json
+import os
+from pathlib import Path
+
+cache_version = 1
+
+
+def read_metadata(filename):
+    """name, version from a METADATA / PKG-INFO file"""
+    name = None
+    version = None
+    with open(str(filename), encoding="utf-8", errors="replace") as op:
+        for line in op:
+            if not line.strip():  # end of headers
+                break
+            if line.startswith("Name:"):
+                name = line[5:].strip()
+            elif line.startswith("Version:"):
+                version = line[8:].strip()
+            if name and version:
+                break
+    return name, version
+
+
+def read_top_level(info_dir):
+    """The top level modules / packages of a distribution"""
+    result = set()
+    top_level = info_dir / "top_level.txt"
+    record = info_dir / "RECORD"
+    if top_level.exists():
+        result.update(x.strip() for x in top_level.read_text().split("\n"))
+    elif record.exists():
+        for line in record.read_text(errors="replace").split("\n"):
+            path = line.split(",", 1)[0]
+            if not path or path.startswith(".."):
+                continue
+            first = path.split("/", 1)[0]
+            if first.endswith(".py"):
+                first = first[:-3]
+            if not first.endswith((".dist-info", ".data")) and first != "__pycache__":
+                result.add(first)
+    result.discard("")
+    return sorted(result)
+
+
+def scan(site_packages):
+    """{name: {'version':..., 'top_level': [...], 'info': dist-info/egg-info name}}"""
+    result = {}
+    site_packages = Path(site_packages)
+    if not site_packages.exists():
+        return result
+    for entry in os.scandir(str(site_packages)):
+        path = site_packages / entry.name
+        if entry.name.endswith((".dist-info", ".egg-info")):
+            metadata = path / (
+                "METADATA" if entry.name.endswith(".dist-info") else "PKG-INFO"
+            )
+            if not entry.is_dir():  # distutils style single file egg-info
+                metadata = path
+            try:
+                name, version = read_metadata(metadata)
+            except OSError:
+                continue
+            if not name:
+                continue
+            result[name] = {
+                "version": version or "unknown",
+                "top_level": read_top_level(path) if entry.is_dir() else [],
+                "info": entry.name,
+            }
+        elif entry.name.endswith(".egg-link"):  # setup.py develop
+            name = entry.name[: -1 * len(".egg-link")]
+            result.setdefault(
+                name, {"version": "unknown", "top_level": [], "info": entry.name}
+            )
+    return result
+
+
+def get_installed(site_packages, cache_filename):
+    """scan(site_packages), cached in cache_filename"""
+    try:
+        mtime = os.stat(str(site_packages)).st_mtime_ns
+    except OSError:
+        return {}
+    try:
+        cached = json.loads(Path(cache_filename).read_text())
+        if cached["version"] == cache_version and cached["mtime"] == mtime:
+            return cached["distributions"]
+    except (OSError, ValueError, KeyError):
+        pass
+    distributions = scan(site_packages)
+    try:
+        temp = Path(str(cache_filename) + ".%i" % os.getpid())
+        temp.write_text(
+            json.dumps(
+                {
+                    "version": cache_version,
+                    "mtime": mtime,
+                    "distributions": distributions,
+                }
+            )
+        )
+        temp.rename(cache_filename)
+    except OSError:
+        pass
+    return distributions
@@ -0,0 +1,142 @@
+# -*- coding: future_fstrings -*-
+"""Installer backends for the python venvs ([base] venv_installer).
+
+Each backend turns the package definitions (pyproject.toml for poetry,
+requirements.txt for pip/uv, both written by the venv fill into work_dir)
+into bash code that installs them into the activated venv.
+
+Resolved versions are kept in storage/poetry_locks (a poetry.lock,
+or pip freeze output used as constraints), so the next venv with the same
+definitions skips the resolution.
+
+- poetry - poetry update / poetry install from a stored lock
+- pip - pip install -r requirements.txt (-c stored constraints)
+- uv - like pip, but with uv (installed into the poetry venv on first use)
+"""
+import re
+from pathlib import Path
+
+
+def store_cmd(source, stored_lock):
+    """bash: atomically copy source to stored_lock, ignoring failures"""
+    return f"{{ cp {source} {stored_lock}.$$ && mv {stored_lock}.$$ {stored_lock} || true; }}"
+
+
+class PoetryInstaller:
+    name = "poetry"
+    lock_suffix = ".lock"
+    prebuild_wheels = True
+    needs_requirements = False
+
+    def get_setup_cmd(self, tools_bin):
+        return ""
+
+    def get_install_cmd(self, work_dir, tools_bin, stored_lock, use_stored_lock):
+        update = (
+            f"cd {work_dir} && {tools_bin}/poetry update --verbose && "
+            + store_cmd("poetry.lock", stored_lock)
+        )
+        if not use_stored_lock:
+            return update
+        return f"""
+cp {stored_lock} {work_dir}/poetry.lock
+if cd {work_dir} && {tools_bin}/poetry install --verbose; then
+    echo "installed from stored lock"
+else
+    echo "install from stored lock failed - falling back to poetry update"
+    {update}
+fi
+"""
+
+    def get_pip(self, tools_bin):
+        return "pip"
+
+    def get_locked_requirements(self, stored_lock):
+        """name==version for every index package pinned in a stored lock"""
+        import tomlkit
+
+        lock = tomlkit.parse(Path(stored_lock).read_text())
+        return [
+            f"{package['name']}=={package['version']}"
+            for package in lock.get("package", [])
+            if "source" not in package  # git / directory packages
+        ]
+
+    def get_delta_cmd(self, tools_bin, pip_args, to_remove):
+        """bash that installs pip_args / removes to_remove and fails
+        if the result is inconsistent"""
+        pip = self.get_pip(tools_bin)
+        steps = []
+        if pip_args:
+            steps.append(
+                f"{pip} install --upgrade-strategy only-if-needed " + " ".join(pip_args)
+            )
+        if to_remove:
+            steps.append(f"{pip} uninstall -y " + " ".join(to_remove))
+        steps.append(f"{pip} check")
+        return " && ".join(steps)
+
+
+class PipInstaller(PoetryInstaller):
+    name = "pip"
+    lock_suffix = ".pip.txt"
+    needs_requirements = True
+
+    def get_install_cmd(self, work_dir, tools_bin, stored_lock, use_stored_lock):
+        pip = self.get_pip(tools_bin)
+        if use_stored_lock:
+            return f"""
+if cd {work_dir} && {pip} install -r requirements.txt -c {stored_lock}; then
+    echo "installed with stored constraints"
+else
+    echo "install with stored constraints failed - resolving again"
+    {pip} install -r requirements.txt && {pip} freeze --exclude-editable > constraints.txt && {store_cmd("constraints.txt", stored_lock)}
+fi
+"""
+        return (
+            f"cd {work_dir} && {pip} install -r requirements.txt && "
+            f"{pip} freeze --exclude-editable > constraints.txt && "
+            + store_cmd("constraints.txt", stored_lock)
+        )
+
+    def get_locked_requirements(self, stored_lock):
+        """name==version for every index package pinned in a stored lock"""
+        return [
+            line.strip()
+            for line in Path(stored_lock).read_text().split("\n")
+            if re.match(r"^[A-Za-z0-9][A-Za-z0-9._-]*==[^\s;@]+$", line.strip())
+        ]
+
+
+class UvInstaller(PipInstaller):
+    name = "uv"
+    lock_suffix = ".uv.txt"
+    prebuild_wheels = False  # uv builds in parallel anyway
+
+    def get_setup_cmd(self, tools_bin):
+        return f"[ -x {tools_bin}/uv ] || {tools_bin}/pip install uv"
+
+    def get_pip(self, tools_bin):
+        return f"{tools_bin}/uv pip"
+
+    def get_delta_cmd(self, tools_bin, pip_args, to_remove):
+        pip = self.get_pip(tools_bin)
+        steps = []
+        if pip_args:
+            steps.append(f"{pip} install " + " ".join(pip_args))
+        if to_remove:
+            steps.append(f"{pip} uninstall " + " ".join(to_remove))
+        steps.append(f"{pip} check")
+        return " && ".join(steps)
+
+
+installers = {x.name: x for x in [PoetryInstaller(), PipInstaller(), UvInstaller()]}
+
+
+def get_installer(name):
+    try:
+        return installers[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown venv_installer {name} - use one of {sorted(installers)}"
+        )
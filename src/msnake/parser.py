@@ -3,7 +3,8 @@ import re
 import os
 from pathlib import Path
 from .anysnake import Anysnake
-import tomlkit
+from .wheelhouse import parse_size
+from .installer import get_installer
 
 
 def merge_config(d1, d2):
@@ -27,6 +28,8 @@ def parse_requirements(req_file):
     See readme.
 
     """
+    import tomlkit
+
     used_files = [str(Path(req_file).absolute())]
     with open(req_file) as op:
         p = tomlkit.loads(op.read())
@@ -34,7 +37,7 @@ def parse_requirements(req_file):
         fn = replace_env_vars(p["base"]["global_config"])
         with open(fn) as op:
             gconfig = tomlkit.loads(op.read())
-            used_files.insert(0, p["base"]["global_config"])
+            used_files.insert(0, str(Path(fn).absolute()))
             p = merge_config(gconfig, p)
 
     paths = [("base", "storage_path")]
@@ -148,11 +151,19 @@ def parsed_to_anysnake(parsed):
 
     docker_build_cmds = parsed.get("base", {}).get("docker_build_cmds", "")
 
+    settings = parse_base_settings(base)
+
+    build_cache_path = base.get("build_cache_path", None)
+    if build_cache_path:
+        build_cache_path = replace_env_vars(build_cache_path)
+
     global_clones = parsed.get("global_clones", {})
     local_clones = parsed.get("local_clones", {})
     check_pip_definitions(global_clones, additional_pip_lookup_res)
     check_pip_definitions(local_clones, additional_pip_lookup_res)
 
+    clone_options = parse_clone_options(parsed.get("clone_options", {}))
+
     return Anysnake(
         project_name=project_name,
         docker_image=docker_image,
@@ -176,9 +187,87 @@ def parsed_to_anysnake(parsed):
         docker_build_cmds=docker_build_cmds,
         global_clones=global_clones,
         local_clones=local_clones,
+        build_cache_path=build_cache_path,
+        clone_options=clone_options,
+        **settings,
     )
 
 
+def at_least_one(name, value):
+    value = int(value)
+    if value < 1:
+        raise ValueError(f"{name} must be >= 1")
+    return value
+
+
+def one_of(*choices):
+    def convert(name, value):
+        if not value in choices:
+            raise ValueError(f"{name} must be one of {choices}")
+        return value
+
+    return convert
+
+
+def size(name, value):
+    value = str(value)
+    parse_size(value)  # raises on invalid sizes
+    return value
+
+
+def installer(name, value):
+    value = str(value)
+    get_installer(value)  # raises on unknown installers
+    return value
+
+
+def plain(converter):
+    return lambda name, value: converter(value)
+
+
+# [base] settings that are passed on to Anysnake unchanged: (name, default, converter)
+base_settings = [
+    ("parallel_builds", 4, at_least_one),
+    ("console_verbosity", "full", one_of("full", "errors", "quiet")),
+    ("compiler_cache", True, plain(bool)),
+    ("compiler_cache_size", "10G", plain(str)),
+    ("version_index_ttl", 24 * 3600, plain(int)),
+    ("wheelhouse", True, plain(bool)),
+    ("wheelhouse_size", "20G", size),
+    ("r_package_cache", True, plain(bool)),
+    ("clone_jobs", 8, at_least_one),
+    ("clone_mirrors", True, plain(bool)),
+    ("venv_installer", "poetry", installer),
+]
+
+
+def parse_base_settings(base):
+    return {
+        name: converter(name, base.get(name, default))
+        for name, default, converter in base_settings
+    }
+
+
+def parse_clone_options(parsed_options):
+    clone_options = {}
+    for name, options in parsed_options.items():
+        if not isinstance(options, dict):
+            raise ValueError(f"clone_options.{name} must be a table")
+        for key in options:
+            if key not in ("depth", "filter"):
+                raise ValueError(
+                    f"Unknown clone option {key} for {name} - use depth or filter"
+                )
+        clone_options[name] = {}
+        if "depth" in options:
+            clone_options[name]["depth"] = at_least_one(
+                f"clone_options.{name}.depth", options["depth"]
+            )
+        if "filter" in options:
+            clone_options[name]["filter"] = str(options["filter"])
+    return clone_options
+
+
 def check_pip_definitions(defs, pip_lookup_regexps):
     for k, v in defs.items():
         for rex, replacement in pip_lookup_regexps:
@@ -0,0 +1,90 @@
+# -*- coding: future_fstrings -*-
+"""Run DockFill strategies concurrently, honoring their declared dependencies.
+
+Each strategy may carry a list of other strategies in .dependencies -
+it is only started once all of those (that are actually scheduled) have
+finished. Independent strategies (e.g. R and Python builds) run
+in parallel, up to max_parallel at once.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . import tracing
+
+
+def get_dependencies(strategy, scheduled):
+    """The dependencies of strategy that are part of scheduled"""
+    return [x for x in getattr(strategy, "dependencies", []) if x in scheduled]
+
+
+def run_strategies(
+    strategies, max_parallel=1, do_time=False, on_done=None, on_interrupt=None
+):
+    """Call ensure() on every strategy, in dependency order.
+
+    Returns the or-ed ensure() results (ie. whether anything was (re)build).
+    on_done(strategy) is called (from this thread) for each successful one.
+    The first exception stops scheduling of further strategies
+    and is reraised once the running ones have finished.
+
+    A KeyboardInterrupt only reaches this thread - on_interrupt() must make
+    the running strategies return (e.g. by killing their containers),
+    since the pool waits for them before the interrupt is reraised.
+    """
+    max_parallel = max(1, int(max_parallel))
+    scheduled = list(strategies)
+    waiting = {s: get_dependencies(s, scheduled) for s in scheduled}
+    done = set()
+    running = {}
+    result = False
+    errors = []
+
+    def timed_ensure(s):
+        start = time.time()
+        with tracing.span(s.__class__.__name__, "strategy"):
+            res = s.ensure()
+        return res, time.time() - start
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        try:
+            while waiting or running:
+                if not errors:
+                    for s in list(waiting):
+                        if len(running) >= max_parallel:
+                            break
+                        if all(d in done for d in waiting[s]):
+                            del waiting[s]
+                            print("=======================")
+                            print("starting", s)
+                            print("=======================")
+                            running[pool.submit(timed_ensure, s)] = s
+                if not running:
+                    if errors:
+                        break
+                    raise ValueError(
+                        "Circular strategy dependencies: %s"
+                        % ([s.__class__.__name__ for s in waiting],)
+                    )
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    s = running.pop(future)
+                    try:
+                        res, runtime = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    result |= bool(res)
+                    done.add(s)
+                    if on_done is not None:
+                        on_done(s)
+                    if do_time:
+                        print(s.__class__.__name__, runtime)
+        except KeyboardInterrupt:
+            for future in running:
+                future.cancel()
+            if on_interrupt is not None:
+                on_interrupt()
+            raise
+    if errors:
+        raise errors[0]
+    return result
@@ -0,0 +1,116 @@
+# -*- coding: future_fstrings -*-
+"""Remember what ensure() produced, so we can skip it when nothing changed.
+
+Every strategy class that offers get_fingerprint(anysnake) (a json-able
+description of its configuration) and get_artifacts() (the paths that prove
+it is done) gets an entry. An entry is current if the fingerprint is unchanged
+and all artifacts still have the recorded mtime & size -
+which costs one stat call per artifact, and no strategy needs to be created.
+Artifacts outside of the storage (the docker image) are checked
+by the class' is_present(anysnake).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+def strategy_key(cls):
+    return cls.__name__
+
+
+def hash_fingerprint(fingerprint):
+    return hashlib.md5(
+        json.dumps(fingerprint, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def stat_artifact(path):
+    try:
+        s = os.stat(str(path))
+    except OSError:
+        return None
+    return [s.st_mtime_ns, s.st_size]
+
+
+class StateManifest:
+    def __init__(self, filename, anysnake):
+        self.filename = Path(filename)
+        self.anysnake = anysnake
+        try:
+            self.entries = json.loads(self.filename.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def supports(cls):
+        return hasattr(cls, "get_fingerprint") and hasattr(cls, "get_artifacts")
+
+    def get_fingerprint(self, cls):
+        return hash_fingerprint(cls.get_fingerprint(self.anysnake))
+
+    def is_current(self, cls):
+        if not self.supports(cls):
+            return False
+        entry = self.entries.get(strategy_key(cls))
+        if entry is None:
+            return False
+        if entry["fingerprint"] != self.get_fingerprint(cls):
+            return False
+        for path, stat in entry["artifacts"].items():
+            if stat_artifact(path) != stat:
+                return False
+        if hasattr(cls, "is_present") and not cls.is_present(self.anysnake):
+            return False
+        return True
+
+    def find_stale(self, dependencies):
+        """All strategy classes that need to run ensure -
+        either because they are not current themselves,
+        or because one of their dependencies is not.
+
+        dependencies is class -> [classes it depends on]"""
+        stale = set(cls for cls in dependencies if not self.is_current(cls))
+        changed = True
+        while changed:
+            changed = False
+            for cls, deps in dependencies.items():
+                if cls not in stale and any(d in stale for d in deps):
+                    stale.add(cls)
+                    changed = True
+        return [cls for cls in dependencies if cls in stale]
+
+    def record(self, strategy):
+        """Record the state after a successful ensure.
+        Strategies whose artifacts are missing are forgotten"""
+        cls = strategy.__class__
+        key = strategy_key(cls)
+        if not self.supports(cls):
+            return
+        artifacts = {}
+        for path in strategy.get_artifacts():
+            stat = stat_artifact(path)
+            if stat is None:
+                self.entries.pop(key, None)
+                return
+            artifacts[str(path)] = stat
+        self.entries[key] = {
+            "fingerprint": self.get_fingerprint(cls),
+            "artifacts": artifacts,
+        }
+
+    def forget(self, strategy):
+        self.entries.pop(strategy_key(strategy.__class__), None)
+
+    def save(self):
+        """Write to a unique temp file and rename -
+        concurrent msnake runs on the same project never see a partial manifest"""
+        self.filename.parent.mkdir(exist_ok=True, parents=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=str(self.filename.parent), prefix=self.filename.name, delete=False
+        ) as op:
+            op.write(json.dumps(self.entries, indent=1, sort_keys=True))
+        os.chmod(op.name, 0o664)  # like everything else in the storage
+        os.rename(op.name, str(self.filename))
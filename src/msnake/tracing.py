@@ -0,0 +1,139 @@
+# -*- coding: future_fstrings -*-
+"""Lightweight build tracing.
+
+Spans are recorded into the module level tracer (if it has been enabled)
+and can be written as a Chrome trace / Perfetto compatible json timeline
+(chrome://tracing, https://ui.perfetto.dev) and summarized as a table.
+
+    with tracing.span("build", log_name="log_python"):
+        ...
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.process_names = {os.getpid(): "msnake"}
+
+    def enable(self):
+        self.enabled = True
+
+    def _add(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def add_complete(
+        self, name, start, duration, category="msnake", args=None, pid=None, tid=None
+    ):
+        """Record a finished span - start / duration in seconds since the epoch"""
+        if not self.enabled:
+            return
+        self._add(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int(start * 1e6),
+                "dur": int(duration * 1e6),
+                "pid": os.getpid() if pid is None else pid,
+                "tid": threading.get_ident() if tid is None else tid,
+                "args": args or {},
+            }
+        )
+
+    def instant(self, name, category="msnake", **args):
+        if not self.enabled:
+            return
+        self._add(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "i",
+                "s": "t",
+                "ts": int(time.time() * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+    @contextlib.contextmanager
+    def span(self, name, category="msnake", **args):
+        """Time the with block. args may be amended inside the block
+        (with span(...) as args: args['hit'] = True)"""
+        if not self.enabled:
+            yield args
+            return
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.add_complete(name, start, time.time() - start, category, args)
+
+    def import_jsonl(self, filename, process_name):
+        """Merge spans recorded elsewhere (e.g. inside a container) -
+        one json object per line with name, start, duration (seconds)
+        and optionally category, pid and args"""
+        if not self.enabled or not Path(filename).exists():
+            return
+        pid = 100000 + len(self.process_names)  # chrome traces want numeric pids
+        self.process_names[pid] = process_name
+        with open(str(filename)) as op:
+            for line in op:
+                try:
+                    e = json.loads(line)
+                except ValueError:  # partially written last line
+                    continue
+                self.add_complete(
+                    e["name"],
+                    e["start"],
+                    e["duration"],
+                    e.get("category", process_name),
+                    e.get("args"),
+                    pid=pid,
+                    tid=e.get("pid", 0),
+                )
+
+    def write_chrome_trace(self, filename):
+        with self.lock:
+            events = list(self.events)
+        for pid, name in self.process_names.items():
+            events.append(
+                {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}}
+            )
+        Path(filename).write_text(
+            json.dumps({"traceEvents": events, "displayTimeUnit": "ms"})
+        )
+
+    def summary(self):
+        """Table of span names by total time"""
+        by_name = {}
+        with self.lock:
+            for e in self.events:
+                if e["ph"] == "X":
+                    count, total, maximum = by_name.get(e["name"], (0, 0, 0))
+                    dur = e["dur"] / 1e6
+                    by_name[e["name"]] = (count + 1, total + dur, max(maximum, dur))
+        width = max([len(x) for x in by_name] + [4])
+        lines = [f"{'span':<{width}}  {'count':>6}  {'total s':>10}  {'max s':>10}"]
+        for name, (count, total, maximum) in sorted(
+            by_name.items(), key=lambda x: -x[1][1]
+        ):
+            lines.append(
+                f"{name:<{width}}  {count:>6}  {total:>10.2f}  {maximum:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+tracer = Tracer()
+span = tracer.span
+instant = tracer.instant
@@ -1,11 +1,13 @@
 # -*- coding: future_fstrings -*-
 import re
-import requests
 import subprocess
+import sys
+import codecs
+import collections
 import time
 import shutil
-import time
 from pathlib import Path
+from . import tracing
 
 re_github = r"[A-Za-z0-9-]+\/[A-Za-z0-9]+"
 
@@ -27,6 +29,14 @@ def combine_volumes(ro=[], rw=[]):
     return d
 
 
+def is_success(return_code):
+    """container.wait() returns an int or {'StatusCode': int}
+    depending on the docker-py version"""
+    if isinstance(return_code, dict):
+        return_code = return_code.get("StatusCode", -1)
+    return return_code == 0
+
+
 def find_storage_path_from_other_machine(anysnake, postfix, check_func=None):
     """Find a usable storage path for this if it was already done by another machine
     and storage_per_hostname is set. 
@@ -50,22 +60,160 @@ def find_storage_path_from_other_machine(anysnake, postfix, check_func=None):
 
 def download_file(url, filename):
     """Download a file with requests if the target does not exist yet"""
+    import requests
+
     if not Path(filename).exists():
         print("downloading", url, filename)
-        r = requests.get(url, stream=True)
-        if r.status_code != 200:
-            raise ValueError(f"Error return on {url} {r.status_code}")
-        start = time.time()
-        count = 0
-        with open(str(filename) + "_temp", "wb") as op:
-            for block in r.iter_content(1024 * 1024):
-                op.write(block)
-                count += len(block)
-        shutil.move(str(filename) + "_temp", str(filename))
-        stop = time.time()
+        with tracing.span("download", url=url) as trace_args:
+            r = requests.get(url, stream=True)
+            if r.status_code != 200:
+                raise ValueError(f"Error return on {url} {r.status_code}")
+            start = time.time()
+            count = 0
+            with open(str(filename) + "_temp", "wb") as op:
+                for block in r.iter_content(1024 * 1024):
+                    op.write(block)
+                    count += len(block)
+            shutil.move(str(filename) + "_temp", str(filename))
+            stop = time.time()
+            trace_args["bytes"] = count
         print("Rate: %.2f MB/s" % ((count / 1024 / 1024 / (stop - start))))
 
 
+class LogSink:
+    """Stream (docker) output into a log file without keeping it in memory.
+
+    Writes are buffered, only the last tail_bytes are kept for error reporting.
+    verbosity decides what ends up on the console:
+        "full" - everything, as it happens
+        "errors" - just the tail, if the job failed (see close())
+        "quiet" - nothing
+    log_file may be a path or an open (binary) file like object.
+    """
+
+    verbosities = ("full", "errors", "quiet")
+
+    def __init__(self, log_file, append=False, verbosity="full", tail_bytes=256 * 1024):
+        if verbosity not in self.verbosities:
+            raise ValueError(f"verbosity must be one of {self.verbosities}")
+        if log_file is None:
+            self.op = None
+            self.own_file = False
+        elif hasattr(log_file, "write"):
+            self.op = log_file
+            self.own_file = False
+        else:
+            self.op = open(
+                str(log_file), "ab" if append else "wb", buffering=1024 * 1024
+            )
+            self.own_file = True
+        self.verbosity = verbosity
+        self.tail_bytes = tail_bytes
+        self.tail = collections.deque()
+        self.tail_size = 0
+        self.total_size = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def write(self, chunk):
+        if self.op is not None:
+            self.op.write(chunk)
+        self.total_size += len(chunk)
+        self.tail.append(chunk)
+        self.tail_size += len(chunk)
+        while self.tail_size - len(self.tail[0]) >= self.tail_bytes:
+            self.tail_size -= len(self.tail.popleft())
+        if self.verbosity == "full":
+            sys.stdout.write(self.decoder.decode(chunk))
+            sys.stdout.flush()
+
+    def get_tail(self):
+        """The last (at least) tail_bytes of output"""
+        return b"".join(self.tail)
+
+    def close(self, failed=False):
+        if self.op is not None:
+            if self.own_file:
+                self.op.close()
+            else:
+                self.op.flush()
+        if failed and self.verbosity == "errors":
+            print(self.get_tail().decode("utf-8", errors="replace"))
+
+
+def sync_files(source_dir, target_dir, manifest_filename, transform=None):
+    """Copy the files of source_dir to target_dir (passing their content through
+    transform), but only those that are new or changed since the last sync
+    (tracked by mtime/size/sha1 in manifest_filename).
+    Files we copied earlier that vanished from source_dir are removed,
+    files in target_dir we did not copy are left alone
+    (unless they are identical to what we would have written).
+
+    Returns (written, removed) lists of file names"""
+    import hashlib
+    import json
+    import os
+
+    source_dir = Path(source_dir)
+    target_dir = Path(target_dir)
+    manifest_filename = Path(manifest_filename)
+    try:
+        manifest = json.loads(manifest_filename.read_text())
+    except (OSError, ValueError):
+        manifest = {}
+    new_manifest = {}
+    written = []
+    for entry in os.scandir(str(source_dir)):
+        try:
+            if entry.is_dir():
+                continue
+            st = entry.stat()
+        except OSError:  # dangling symlink
+            continue
+        stat_key = [st.st_mtime_ns, st.st_size]
+        known = manifest.get(entry.name)
+        output_fn = target_dir / entry.name
+        output_exists = os.path.lexists(str(output_fn))
+        if known and known[:2] == stat_key and (known[2] is None or output_exists):
+            new_manifest[entry.name] = known
+            continue
+        input = Path(entry.path).read_bytes()
+        digest = hashlib.sha1(input).hexdigest()
+        output = transform(input) if transform is not None else input
+        if output_exists and (known is None or known[2] is None):
+            # a file we did not write (e.g. the venv's own python) -
+            # adopt it if it's what we would have written, otherwise leave it be
+            try:
+                ours = output_fn.read_bytes() == output
+            except OSError:
+                ours = False
+            new_manifest[entry.name] = stat_key + [digest if ours else None]
+            continue
+        new_manifest[entry.name] = stat_key + [digest]
+        if known and known[2] == digest and output_exists:  # touched only
+            continue
+        if output_exists:
+            output_fn.unlink()
+        output_fn.write_bytes(output)
+        output_fn.chmod(st.st_mode & 0o7777)
+        written.append(entry.name)
+    removed = []
+    for name, known in manifest.items():
+        if (
+            name not in new_manifest
+            and known[2] is not None
+            and not os.path.lexists(str(source_dir / name))
+        ):
+            output_fn = target_dir / name
+            if os.path.lexists(str(output_fn)):
+                output_fn.unlink()
+            removed.append(name)
+    if new_manifest != manifest:
+        temp = manifest_filename.with_name(manifest_filename.name + ".temp")
+        temp.write_text(json.dumps(new_manifest))
+        temp.rename(manifest_filename)
+    return written, removed
+
+
 def dict_to_toml(d):
     import tomlkit
 
@@ -98,7 +246,55 @@ def get_next_free_port(start_at):
     return port
 
 
-def clone_repo(url, name, target_path, log_file):
+def update_mirror(method, url, mirror_path, log_file):
+    """Create / fetch into the bare mirror of url below mirror_path.
+    Returns the mirror's path, or None if it could not be updated"""
+    import fcntl
+    import hashlib
+
+    mirror_path = Path(mirror_path)
+    mirror_path.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", url.rstrip("/").rsplit("/", 1)[-1])
+    mirror = mirror_path / f"{method}_{name}_{key}"
+    with open(str(mirror) + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one fetch per mirror at a time
+        if mirror.exists():
+            if method == "git":
+                cmd = ["git", "--git-dir", str(mirror), "fetch", "--prune", "origin"]
+            else:
+                cmd = ["hg", "pull", "-R", str(mirror), url]
+        else:
+            temp = mirror.with_name(mirror.name + ".temp")
+            if temp.exists():
+                shutil.rmtree(str(temp))
+            if method == "git":
+                cmd = ["git", "clone", "--mirror", url, str(temp)]
+            else:
+                cmd = ["hg", "clone", "-U", url, str(temp)]
+        log_file.write(f"updating mirror {mirror}\n".encode("utf-8"))
+        log_file.flush()
+        try:
+            subprocess.check_call(cmd, stdout=log_file, stderr=log_file)
+        except (subprocess.CalledProcessError, OSError):
+            log_file.write(b"mirror update failed - cloning without mirror\n")
+            log_file.flush()
+            return None
+        if not mirror.exists():
+            temp.rename(mirror)
+    return mirror
+
+
+def clone_repo(
+    url, name, target_path, log_file, depth=None, filter=None, mirror_path=None
+):
+    """Clone a git / hg repo. depth and filter (e.g. 'blob:none')
+    allow shallow / partial git clones.
+
+    With a mirror_path, a bare mirror of every repo is kept (and fetched into)
+    there, and used as reference - only the changes since the last clone of the
+    repo need to be transferred. Not for shallow / partial git clones though -
+    a full mirror would download the very history they are meant to skip"""
     print(f"]\tCloning {name} to {target_path} from {url}")
     if url.startswith("@"):
         url = url[1:]
@@ -115,26 +311,84 @@ def clone_repo(url, name, target_path, log_file):
         raise ValueError(
             "Could not parse url / must be git+http(s) / hg+https, or github path"
         )
-    if method == "git":
+    with tracing.span("clone " + name, url=url) as trace_args:
+        mirror = None
+        if mirror_path is not None and not (method == "git" and (depth or filter)):
+            mirror = update_mirror(method, url, mirror_path, log_file)
+        trace_args["mirror"] = mirror is not None
         try:
-            subprocess.check_call(
-                ["git", "clone", url, str(target_path)],
-                stdout=log_file,
-                stderr=log_file,
-            )
+            if method == "git":
+                cmd = ["git", "clone"]
+                if mirror is not None:
+                    # --dissociate: copy the objects, the clone must not break
+                    # if the mirror is removed
+                    cmd.extend(["--reference", str(mirror), "--dissociate"])
+                if depth:
+                    cmd.extend(["--depth", str(int(depth))])
+                if filter:
+                    cmd.append(f"--filter={filter}")
+                subprocess.check_call(
+                    cmd + [url, str(target_path)], stdout=log_file, stderr=log_file
+                )
+            elif method == "hg":
+                if depth or filter:
+                    log_file.write(b"hg does not support shallow clones\n")
+                    log_file.flush()
+                if mirror is not None:
+                    # hg share would depend on the mirror, so clone it
+                    # (hardlinks) and pull whatever it's missing from upstream
+                    subprocess.check_call(
+                        ["hg", "clone", "-U", str(mirror), str(target_path)],
+                        stdout=log_file,
+                        stderr=log_file,
+                    )
+                    (target_path / ".hg" / "hgrc").write_text(
+                        f"[paths]\ndefault = {url}\n"
+                    )
+                    for cmd in (["pull"], ["update"]):
+                        subprocess.check_call(
+                            ["hg"] + cmd + ["-R", str(target_path)],
+                            stdout=log_file,
+                            stderr=log_file,
+                        )
+                else:
+                    subprocess.check_call(
+                        ["hg", "clone", url, str(target_path)],
+                        stdout=log_file,
+                        stderr=log_file,
+                    )
         except subprocess.CalledProcessError:
-            import shutil
-
-            shutil.rmtree(target_path)
+            if target_path.exists():
+                shutil.rmtree(str(target_path))
             raise
-    elif method == "hg":
-        try:
-            subprocess.check_call(
-                ["hg", "clone", url, str(target_path)], stdout=log_file, stderr=log_file
+
+
+def clone_repos(todo, jobs=8, options={}, mirror_path=None):
+    """Clone several repos in parallel.
+
+    todo: [(name, url, target_path, log_filename)]
+    options: name -> {'depth': n, 'filter': 'blob:none'}
+    Raises a ValueError naming all failed clones once all are done."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def clone(name, url, target_path, log_filename):
+        with open(str(log_filename), "wb") as log_file:
+            clone_repo(
+                url,
+                name,
+                target_path,
+                log_file,
+                mirror_path=mirror_path,
+                **options.get(name, {}),
             )
-        except subprocess.CalledProcessError:
-            import shutil
 
-            if target_path.exists():
-                shutil.rmtree(target_path)
-            raise
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [(entry, pool.submit(clone, *entry)) for entry in todo]
+        for (name, url, target_path, log_filename), future in futures:
+            try:
+                future.result()
+            except (subprocess.CalledProcessError, ValueError, OSError) as e:
+                failed.append(f"{name} ({e}) - see {log_filename}")
+    if failed:
+        raise ValueError("Cloning failed: " + ", ".join(failed))
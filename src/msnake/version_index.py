@@ -0,0 +1,86 @@
+# -*- coding: future_fstrings -*-
+"""Local cache for the pages we look up versions in
+(python.org/doc/versions, CRAN's src/base/R-x listings,
+bioconductor's release announcements).
+
+Pages younger than ttl seconds are used as is, older ones are revalidated
+(ETag / Last-Modified), and if the network is unavailable,
+whatever we have is used - so builds work offline.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+class VersionIndex:
+    def __init__(self, path, ttl=24 * 3600, timeout=10):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def get_filenames(self, url):
+        key = hashlib.md5(url.encode("utf-8")).hexdigest()
+        return self.path / (key + ".json"), self.path / (key + ".body")
+
+    def get(self, url):
+        """The (possibly cached) text of url, or None if it is neither
+        reachable nor cached"""
+        import requests
+
+        meta_filename, body_filename = self.get_filenames(url)
+        try:
+            meta = json.loads(meta_filename.read_text())
+            body = body_filename.read_text()
+        except (OSError, ValueError):
+            meta = None
+            body = None
+        if meta is not None and time.time() - meta["fetched"] < self.ttl:
+            return body
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            r = requests.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            if body is not None:
+                print(f"Could not reach {url} ({e}) - using cached copy")
+            return body
+        if r.status_code == 304 and body is not None:
+            meta["fetched"] = time.time()
+        elif r.status_code == 200:
+            body = r.text
+            meta = {
+                "url": url,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "fetched": time.time(),
+            }
+        else:
+            if body is not None:
+                print(f"Error {r.status_code} on {url} - using cached copy")
+            return body
+        self.store(meta_filename, json.dumps(meta))
+        self.store(body_filename, body)
+        return body
+
+    def store(self, filename, text):
+        self.path.mkdir(exist_ok=True, parents=True)
+        temp = filename.with_name(
+            filename.name + ".%i.%i" % (os.getpid(), threading.get_ident())
+        )
+        temp.write_text(text)
+        temp.rename(filename)
+
+    def prefetch(self, urls, jobs=4):
+        """Fetch / revalidate several urls at once"""
+        urls = sorted(set(urls))
+        if urls:
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                list(pool.map(self.get, urls))
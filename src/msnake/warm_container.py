@@ -0,0 +1,233 @@
+# -*- coding: future_fstrings -*-
+"""A long lived, per project container that 'msnake run' sends
+commands to via docker exec - saving the docker run / mount / startup
+overhead on every call.
+
+The container is labeled with ANYSNAKE_PROJECT_PATH and a fingerprint of
+its docker run arguments - if the configuration changes, it is replaced.
+It shuts itself down once nothing has been run for idle_timeout seconds.
+
+Bookkeeping happens in a per container directory (mounted at /anysnake/warm):
+    idle.sh - the containers main loop
+    last_used - touched on every run
+    running_<pid> - markers for currently executing commands
+    run_<pid>.sh - the scripts being executed
+"""
+import fcntl
+import hashlib
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+fingerprint_label = "anysnake.fingerprint"
+
+idle_script = """
+touch /anysnake/warm/last_used
+while true; do
+    sleep %(poll_interval)i
+    busy=0
+    for marker in /anysnake/warm/running_*; do
+        [ -e "$marker" ] || continue
+        if kill -0 "${marker##*_}" 2>/dev/null; then
+            busy=1
+        else
+            rm -f "$marker"
+        fi
+    done
+    if [ $busy -eq 1 ]; then
+        continue
+    fi
+    last_used=$(stat -c %%Y /anysnake/warm/last_used)
+    if [ $(( $(date +%%s) - last_used )) -gt %(idle_timeout)i ]; then
+        exit 0
+    fi
+done
+"""
+
+run_script_wrapper = """
+touch /anysnake/warm/running_$$
+trap 'rm -f /anysnake/warm/running_$$; touch /anysnake/warm/last_used' EXIT
+cd /project
+"""
+
+
+class WarmContainer:
+    def __init__(self, anysnake, idle_timeout=1800, poll_interval=10):
+        self.anysnake = anysnake
+        self.idle_timeout = int(idle_timeout)
+        self.poll_interval = int(poll_interval)
+        self.project_path = str(Path(".").absolute())
+        self.name = (
+            "msnake_"
+            + hashlib.md5(self.project_path.encode("utf-8")).hexdigest()[:12]
+        )
+        self.dir = anysnake.paths["per_user"] / "warm" / self.name
+
+    def get_fingerprint(self, docker_args, ports):
+        """Hash the docker run arguments. The port mappings are taken
+        from the configuration instead - '8888+' becomes the next free port,
+        which may change from run to run"""
+        relevant = [self.anysnake.docker_image, str(self.idle_timeout)]
+        relevant.extend("%s:%s" % tuple(x) for x in self.anysnake.ports)
+        relevant.extend("%s:%s" % tuple(x) for x in sorted(ports))
+        skip_next = False
+        for arg in docker_args:
+            if skip_next:
+                skip_next = False
+            elif arg == "-p":
+                skip_next = True
+            else:
+                relevant.append(str(arg))
+        return hashlib.md5("\n".join(relevant).encode("utf-8")).hexdigest()
+
+    def get_running_fingerprint(self):
+        """The fingerprint of the running container, False if there is
+        a stopped one, None if there is none"""
+        p = subprocess.Popen(
+            [
+                "docker",
+                "inspect",
+                "--format",
+                "{{.State.Running}} {{index .Config.Labels \"%s\"}}"
+                % fingerprint_label,
+                self.name,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        stdout, _ = p.communicate()
+        if p.returncode != 0:
+            return None
+        running, fingerprint = (stdout.decode("utf-8").strip().split(" ", 1) + [""])[
+            :2
+        ]
+        if running != "true":
+            return False
+        return fingerprint
+
+    def stop(self):
+        subprocess.Popen(
+            ["docker", "rm", "-f", self.name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ).communicate()
+
+    def start(self, docker_args, fingerprint):
+        cmd = [
+            "docker",
+            "run",
+            "-d",
+            "--rm",
+            "--init",
+            "--name",
+            self.name,
+            "--label",
+            f"ANYSNAKE_PROJECT_PATH={self.project_path}",
+            "--label",
+            f"{fingerprint_label}={fingerprint}",
+        ]
+        cmd.extend(docker_args)
+        cmd.extend(
+            [
+                self.anysnake.docker_image,
+                "/anysnake/gosu",
+                self.anysnake.get_login_username(),
+                "/bin/bash",
+                "/anysnake/run.sh",
+            ]
+        )
+        print("starting warm container", self.name)
+        p = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+        p.communicate()
+        if p.returncode != 0:
+            raise ValueError(f"Could not start warm container {self.name}")
+
+    def ensure(
+        self,
+        env={},
+        ports={},
+        py_spy_support=True,
+        volumes_ro={},
+        volumes_rw={},
+        allow_writes=False,
+    ):
+        """Make sure a container with the current configuration is running"""
+        self.dir.mkdir(exist_ok=True, parents=True)
+        idle_filename = self.dir / "idle.sh"
+        idle_filename.write_text(
+            idle_script
+            % {"idle_timeout": self.idle_timeout, "poll_interval": self.poll_interval}
+        )
+        (self.dir / "last_used").touch()
+        volumes_rw = dict(volumes_rw)
+        volumes_rw["/anysnake/warm"] = self.dir
+        docker_args = self.anysnake.get_docker_run_args(
+            idle_filename,
+            env=env,
+            ports=ports,
+            py_spy_support=py_spy_support,
+            volumes_ro=volumes_ro,
+            volumes_rw=volumes_rw,
+            allow_writes=allow_writes,
+        )
+        fingerprint = self.get_fingerprint(docker_args, ports)
+        # concurrent 'msnake run's must not start two containers
+        with open(str(self.dir / "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            running_fingerprint = self.get_running_fingerprint()
+            if running_fingerprint == fingerprint:
+                return
+            if running_fingerprint is not None:
+                print("configuration changed - restarting warm container", self.name)
+                self.stop()
+            self.start(docker_args, fingerprint)
+
+    def run(
+        self,
+        bash_script,
+        env={},
+        ports={},
+        py_spy_support=True,
+        home_files={},
+        home_dirs={},
+        volumes_ro={},
+        volumes_rw={},
+        allow_writes=False,
+    ):
+        """Execute bash_script inside the warm container, starting it if necessary.
+        Returns the exit code"""
+        self.ensure(
+            env=env,
+            ports=ports,
+            py_spy_support=py_spy_support,
+            volumes_ro=volumes_ro,
+            volumes_rw=volumes_rw,
+            allow_writes=allow_writes,
+        )
+        script_name = f"run_{os.getpid()}.sh"
+        script_filename = self.dir / script_name
+        script_filename.write_text(
+            run_script_wrapper + self.anysnake.get_run_script(bash_script)
+        )
+        (self.dir / "last_used").touch()
+        cmd = ["docker", "exec", "-i"]
+        if sys.stdin.isatty() and sys.stdout.isatty():
+            cmd.append("-t")
+        cmd.extend(
+            [
+                "-u",
+                self.anysnake.get_login_username(),
+                "-w",
+                "/project",
+                self.name,
+                "/bin/bash",
+                "/anysnake/warm/" + script_name,
+            ]
+        )
+        try:
+            p = subprocess.Popen(cmd)
+            p.communicate()
+        finally:
+            script_filename.unlink()
+        return p.returncode
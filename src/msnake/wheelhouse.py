@@ -0,0 +1,92 @@
+# -*- coding: future_fstrings -*-
+"""A wheelhouse + pip/poetry cache shared by all containers
+(and all projects using the same storage path and python version).
+
+storage/wheelhouse/<python_version>-<machine>/
+    wheels - prebuild wheels, offered to pip via PIP_FIND_LINKS
+    pip_cache - PIP_CACHE_DIR (downloads & wheels pip build itself)
+    poetry_cache - POETRY_CACHE_DIR
+    uv_cache - UV_CACHE_DIR
+
+The whole directory is kept below a size limit by evicting the least
+recently used files.
+"""
+import os
+import platform
+import re
+import shlex
+from pathlib import Path
+
+docker_path = "/anysnake/wheelhouse"
+
+
+def get_path(storage_path, python_version):
+    return Path(storage_path) / "wheelhouse" / f"{python_version}-{platform.machine()}"
+
+
+def get_environment():
+    return {
+        "PIP_FIND_LINKS": docker_path + "/wheels",
+        "PIP_CACHE_DIR": docker_path + "/pip_cache",
+        "POETRY_CACHE_DIR": docker_path + "/poetry_cache",
+        "UV_CACHE_DIR": docker_path + "/uv_cache",
+        "UV_FIND_LINKS": docker_path + "/wheels",
+    }
+
+
+def get_prebuild_script(pip, requirements, jobs, no_deps=False):
+    """bash code to pip wheel requirements (in parallel) into the wheelhouse.
+    Failures are ignored - the install step will report them.
+    no_deps skips the dependency resolution, for fully pinned requirements"""
+    if not requirements:
+        return ""
+    quoted = " ".join(shlex.quote(x) for x in sorted(requirements))
+    options = "-q --no-deps" if no_deps else "-q"
+    return f"""
+mkdir -p {docker_path}/wheels
+anysnake_build_wheel() {{
+    temp_dir=$(mktemp -d)
+    {pip} wheel {options} -w "$temp_dir" "$1" && mv -f "$temp_dir"/*.whl {docker_path}/wheels/
+    rm -rf "$temp_dir"
+}}
+export -f anysnake_build_wheel
+echo "prebuilding wheels"
+printf '%s\\0' {quoted} | xargs -0 -n 1 -P {int(jobs)} bash -c 'anysnake_build_wheel "$0"' || true
+"""
+
+
+def parse_size(size):
+    """'20G' / '500M' / 1234 -> bytes"""
+    m = re.match(r"^(\d+(?:\.\d+)?)\s*([KMGT]?)B?$", str(size).strip(), re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Could not parse size {size} - use e.g. 20G")
+    factor = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    return int(float(m.group(1)) * factor[m.group(2).upper()])
+
+
+def evict(path, max_bytes):
+    """Remove the least recently used files until path is below max_bytes.
+    Returns the number of bytes removed"""
+    files = []
+    total = 0
+    for root, dirs, filenames in os.walk(str(path)):
+        for fn in filenames:
+            full = os.path.join(root, fn)
+            try:
+                s = os.lstat(full)
+            except OSError:
+                continue
+            files.append((max(s.st_atime, s.st_mtime), s.st_size, full))
+            total += s.st_size
+    removed = 0
+    if total > max_bytes:
+        files.sort()
+        for _, size, full in files:
+            if total - removed <= max_bytes:
+                break
+            try:
+                os.unlink(full)
+                removed += size
+            except OSError:  # e.g. written by a root container
+                continue
+    return removed
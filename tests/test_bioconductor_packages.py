@@ -0,0 +1,94 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from msnake._inside_dockfill_bioconductor import RPackageInfo
+
+package_count = 25000
+# parsing a package_count index may take at most this many seconds
+# (generous - the suite runs under coverage)
+budget_s = 3.0
+
+example = """Package: A3
+Version: 1.0.0
+Depends: R (>= 2.15.0), xtable, pbapply
+Suggests: randomForest, e1071
+License: GPL (>= 2)
+MD5sum: 027ebdd8affce8f0effaecfcd5f5ade2
+NeedsCompilation: no
+
+Package: abc
+Version: 2.1
+Depends: R (>= 2.10), abc.data, nnet, quantreg, MASS,
+        locfit
+Imports: grDevices, graphics, stats
+License: GPL (>= 3)
+MD5sum: c9fffe4334c178917f762735aba59653
+NeedsCompilation: no
+"""
+
+
+def synthetic_index(count):
+    parts = []
+    for i in range(count):
+        deps = ", ".join("pkg%i (>= 1.%i)" % (j, j % 7) for j in range(i % 5, i, 997))
+        parts.append(
+            "Package: pkg%i\n"
+            "Version: 1.%i.0\n"
+            "Depends: R (>= 3.0), methods%s\n"
+            "Imports: stats, utils,\n        grid\n"
+            "License: GPL-2\n"
+            "MD5sum: %032x\n"
+            "NeedsCompilation: yes\n" % (i, i % 13, (", " + deps) if deps else "", i)
+        )
+    return "\n".join(parts)
+
+
+class RPackageInfoTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = Path(self.temp_dir.name) / "cran.PACKAGES"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get(self, text):
+        self.filename.write_text(text)
+        return RPackageInfo("https://cran.example.com/", "cran", self.filename).get()
+
+    def test_parse(self):
+        pkgs = self.get(example)
+        self.assertEqual(sorted(pkgs), ["A3", "abc"])
+        self.assertEqual(pkgs["A3"]["Depends"], {"R", "xtable", "pbapply"})
+        self.assertEqual(
+            pkgs["abc"]["Depends"],
+            {"R", "abc.data", "nnet", "quantreg", "MASS", "locfit"},
+        )
+        self.assertEqual(pkgs["abc"]["imports"], set())  # all build in
+        self.assertEqual(
+            pkgs["abc"]["url"], "https://cran.example.com/src/contrib/abc_2.1.tar.gz"
+        )
+
+    def test_cache(self):
+        self.get(example)
+        cache_filename = Path(str(self.filename) + ".pickle")
+        self.assertTrue(cache_filename.exists())
+        pkgs = self.get(example)  # from the cache
+        self.assertEqual(pkgs["A3"]["version"], "1.0.0")
+        pkgs = self.get(example.replace("Version: 1.0.0", "Version: 1.0.1"))
+        self.assertEqual(pkgs["A3"]["version"], "1.0.1")
+
+    def test_benchmark(self):
+        text = synthetic_index(package_count)
+        start = time.time()
+        pkgs = self.get(text)
+        parse_time = time.time() - start
+        self.assertEqual(len(pkgs), package_count)
+        self.assertEqual(pkgs["pkg5"]["Imports"], {"stats", "utils", "grid"})
+        start = time.time()
+        self.assertEqual(len(self.get(text)), package_count)
+        cached_time = time.time() - start
+        print("parse: %.2fs, cached: %.2fs" % (parse_time, cached_time))
+        self.assertLess(parse_time, budget_s)
+        self.assertLess(cached_time, parse_time)
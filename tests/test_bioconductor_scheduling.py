@@ -0,0 +1,150 @@
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from msnake import _inside_dockfill_bioconductor as inside
+
+
+def info(name, version="1.0", depends=(), linking_to=()):
+    return {
+        "name": name,
+        "version": version,
+        "Depends": set(depends),
+        "Imports": set(),
+        "LinkingTo": set(linking_to),
+    }
+
+
+class FakeGraph:
+    """The pypipegraph internals prioritize_by_critical_path hooks into"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def build_todo_list(self):
+        self.possible_execution_order = list(self.jobs)
+
+
+class FakeJob:
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+
+class CriticalPathTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = Path(self.temp_dir.name)
+        self.old_env = os.environ.copy()
+        os.environ["R_PACKAGE_CACHE"] = str(self.cache)
+        os.environ["DOCKER_IMAGE"] = "image:1"
+        os.environ["R_VERSION"] = "3.6.0"
+        inside.install_history = None
+        # a <- b <- d, a <- c, e standalone
+        self.infos = {
+            "a": info("a"),
+            "b": info("b", depends=["a", "R"]),
+            "c": info("c", depends=["a"]),
+            "d": info("d", depends=["b"]),
+            "e": info("e"),
+        }
+        self.record_history(a=10, b=100, c=5, e=50)
+
+    def tearDown(self):
+        inside.install_history = None
+        os.environ.clear()
+        os.environ.update(self.old_env)
+        self.temp_dir.cleanup()
+
+    def record_history(self, **seconds):
+        history = self.cache / "install_history"
+        history.mkdir(exist_ok=True)
+        for name, s in seconds.items():
+            (history / name).write_text(json.dumps({"seconds": s, "peak_rss": None}))
+
+    def test_bottom_levels(self):
+        priorities = inside.get_critical_path_priorities(set(self.infos), self.infos)
+        # d was never build - it's expected to take the median (50)
+        self.assertEqual(priorities, {"a": 160, "b": 150, "c": 5, "d": 50, "e": 50})
+
+    def test_only_todo_and_cached_binaries(self):
+        binary_fn = inside.get_binary_cache_filename(self.infos["b"], self.infos)
+        Path(binary_fn).parent.mkdir(parents=True)
+        Path(binary_fn).write_text("binary")
+        priorities = inside.get_critical_path_priorities(
+            set(["b", "c", "d"]), self.infos
+        )
+        self.assertEqual(
+            priorities, {"b": inside.binary_duration + 50, "c": 5, "d": 50}
+        )
+
+    def test_prioritize(self):
+        jobs = [FakeJob(x) for x in "abc"]
+        graph = FakeGraph(jobs)
+        self.assertTrue(inside.prioritize_by_critical_path(graph, {"c": 3, "b": 2}))
+        graph.build_todo_list()
+        self.assertEqual(
+            [x.job_id for x in graph.possible_execution_order], list("cba")
+        )
+
+    def test_prioritize_without_internals(self):
+        self.assertFalse(inside.prioritize_by_critical_path(object(), {"a": 1}))
+
+
+class JobserverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.old_ledger = inside.memory_ledger_filename
+        inside.memory_ledger_filename = str(Path(self.temp_dir.name) / "ledger")
+        inside.start_jobserver(2)
+
+    def tearDown(self):
+        for fd in inside.jobserver_fds:
+            os.close(fd)
+        inside.jobserver_fds = None
+        inside.memory_ledger_filename = self.old_ledger
+        self.temp_dir.cleanup()
+
+    def test_tokens_are_returned(self):
+        with inside.jobserver_token():
+            self.assertEqual(inside.get_available_tokens(), 1)
+            with self.assertRaises(ValueError):
+                with inside.jobserver_token():
+                    self.assertEqual(inside.get_available_tokens(), 0)
+                    raise ValueError()
+        self.assertEqual(inside.get_available_tokens(), 2)
+
+    def test_nonblocking_read_end(self):
+        fd = inside.jobserver_fds[0]
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        with inside.jobserver_token(), inside.jobserver_token():
+            self.assertEqual(inside.get_available_tokens(), 0)
+        self.assertEqual(inside.get_available_tokens(), 2)
+
+    def test_lost_tokens_are_refilled_once_idle(self):
+        with inside.memory_reservation("a", 1, budget=10):
+            os.read(inside.jobserver_fds[0], 1)  # held by a process that died
+            with inside.memory_ledger():
+                pass  # 'a' is running - nothing to refill
+            self.assertEqual(inside.get_available_tokens(), 1)
+        with inside.memory_ledger():
+            pass
+        self.assertEqual(inside.get_available_tokens(), 2)
+
+
+class PeakMemoryTestCase(unittest.TestCase):
+    def test_whole_process_tree_is_measured(self):
+        # two children, 64 MB each, at the same time
+        child = "x = b'x' * (64 * 1024 ** 2); import time; time.sleep(1.5)"
+        p = subprocess.Popen(
+            ["sh", "-c", '"$0" -c "$1" & "$0" -c "$1"; wait', sys.executable, child],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        stdout, stderr, peak = inside.measure_peak_memory(p, interval=0.1)
+        self.assertEqual(p.returncode, 0)
+        self.assertGreater(peak, 128 * 1024 ** 2)
@@ -0,0 +1,89 @@
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from msnake.util import clone_repo, clone_repos
+
+
+def git(*args, cwd=None):
+    return subprocess.check_output(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        + list(args),
+        cwd=str(cwd) if cwd else None,
+    ).decode("utf-8")
+
+
+@unittest.skipUnless(shutil.which("git"), "git not available")
+class CloneMirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.temp_dir.name)
+        self.upstream = self.base / "upstream"
+        self.upstream.mkdir()
+        git("init", "-q", cwd=self.upstream)
+        self.commit("first")
+        self.url = "git+file://" + str(self.upstream)
+        self.mirrors = self.base / "mirrors"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def commit(self, content):
+        (self.upstream / "file.txt").write_text(content)
+        git("add", "file.txt", cwd=self.upstream)
+        git("commit", "-q", "-m", content, cwd=self.upstream)
+
+    def clone(self, name, **options):
+        target = self.base / name
+        with open(str(self.base / (name + ".log")), "wb") as log_file:
+            clone_repo(
+                self.url, name, target, log_file, mirror_path=self.mirrors, **options
+            )
+        return target
+
+    def test_mirror_is_created_and_updated(self):
+        first = self.clone("first")
+        self.assertEqual((first / "file.txt").read_text(), "first")
+        mirrors = [x for x in self.mirrors.iterdir() if x.is_dir()]
+        self.assertEqual(len(mirrors), 1)
+        self.assertEqual(
+            git("--git-dir", str(mirrors[0]), "rev-list", "--count", "HEAD").strip(),
+            "1",
+        )
+
+        self.commit("second")
+        second = self.clone("second")
+        self.assertEqual((second / "file.txt").read_text(), "second")
+        self.assertEqual(
+            git("--git-dir", str(mirrors[0]), "rev-list", "--count", "HEAD").strip(),
+            "2",
+        )
+        # dissociated - the clone must survive the mirror's removal
+        self.assertFalse((second / ".git" / "objects" / "info" / "alternates").exists())
+        shutil.rmtree(str(mirrors[0]))
+        self.assertEqual(
+            git("log", "--format=%s", cwd=second).split(), ["second", "first"]
+        )
+        self.assertEqual(
+            git("remote", "get-url", "origin", cwd=second).strip(),
+            "file://" + str(self.upstream),
+        )
+
+    def test_shallow_clones_skip_the_mirror(self):
+        self.commit("second")
+        shallow = self.clone("shallow", depth=1)
+        self.assertEqual(git("rev-list", "--count", "HEAD", cwd=shallow).strip(), "1")
+        partial = self.clone("partial", filter="blob:none")
+        self.assertEqual((partial / "file.txt").read_text(), "second")
+        self.assertFalse(self.mirrors.exists() and list(self.mirrors.iterdir()))
+
+    def test_unreachable_upstream_fails(self):
+        self.url = "git+file://" + str(self.base / "does_not_exist")
+        with self.assertRaises(ValueError):
+            clone_repos(
+                [("broken", self.url, self.base / "broken", self.base / "broken.log")],
+                mirror_path=self.mirrors,
+            )
+        self.assertFalse((self.base / "broken").exists())
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from msnake.config_cache import load_anysnake
+
+
+class ConfigCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.temp_dir.name)
+        self.old_cwd = os.getcwd()
+        self.old_env = os.environ.copy()
+        os.environ["HOME"] = str(self.base / "home")
+        os.environ["MSNAKE_TEST_CONFIG_DIR"] = str(self.base / "global")
+        (self.base / "home").mkdir()
+        (self.base / "global").mkdir()
+        (self.base / "project").mkdir()
+        os.chdir(str(self.base / "project"))
+        self.global_config = self.base / "global" / "global.toml"
+        self.write_global_config("3.7.4")
+        Path("anysnake.toml").write_text(
+            "[base]\n"
+            'global_config = "${MSNAKE_TEST_CONFIG_DIR}/global.toml"\n'
+            'docker_image = "test_image:1"\n'
+            'storage_path = "${MSNAKE_TEST_STORAGE}"\n'
+        )
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        os.environ.clear()
+        os.environ.update(self.old_env)
+        self.temp_dir.cleanup()
+
+    def write_global_config(self, python_version):
+        self.global_config.write_text(
+            "[base]\n"
+            f'python = "{python_version}"\n'
+            'storage_path = "${MSNAKE_TEST_STORAGE}"\n'
+        )
+
+    def test_global_config_edit_invalidates(self):
+        os.environ["MSNAKE_TEST_STORAGE"] = str(self.base / "storage_a")
+        anysnake, parsed = load_anysnake("anysnake.toml")
+        self.assertEqual(anysnake.python_version, "3.7.4")
+        self.assertEqual(parsed["used_files"][0], str(self.global_config))
+
+        time.sleep(0.01)  # a different mtime, even on coarse filesystems
+        self.write_global_config("3.8.1")
+        anysnake, parsed = load_anysnake("anysnake.toml")
+        self.assertEqual(anysnake.python_version, "3.8.1")
+
+        # referenced environment variables are part of the key
+        os.environ["MSNAKE_TEST_STORAGE"] = str(self.base / "storage_b")
+        anysnake, parsed = load_anysnake("anysnake.toml")
+        self.assertEqual(anysnake.storage_path, self.base / "storage_b")
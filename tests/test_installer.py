@@ -0,0 +1,46 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from msnake.installer import get_installer
+
+
+class LockedRequirementsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.lock = Path(self.temp_dir.name) / "lock"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_poetry_lock(self):
+        self.lock.write_text(
+            "[[package]]\n"
+            'name = "requests"\n'
+            'version = "2.22.0"\n'
+            "\n"
+            "[[package]]\n"
+            'name = "mypkg"\n'
+            'version = "0.1"\n'
+            "\n"
+            "[package.source]\n"
+            'type = "directory"\n'
+            'url = "code/mypkg"\n'
+        )
+        self.assertEqual(
+            get_installer("poetry").get_locked_requirements(self.lock),
+            ["requests==2.22.0"],
+        )
+
+    def test_pip_constraints(self):
+        self.lock.write_text(
+            "requests==2.22.0\n"
+            "pandas==1.0.1\n"
+            "mypkg @ file:///code/mypkg\n"
+            "-e git+https://example.com/x#egg=x\n"
+        )
+        for name in ("pip", "uv"):
+            self.assertEqual(
+                get_installer(name).get_locked_requirements(self.lock),
+                ["requests==2.22.0", "pandas==1.0.1"],
+            )
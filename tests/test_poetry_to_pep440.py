@@ -0,0 +1,33 @@
+import unittest
+
+from msnake.dockfill_python import poetry_to_pep440
+
+
+class PoetryToPep440TestCase(unittest.TestCase):
+    def test_caret(self):
+        self.assertEqual(poetry_to_pep440("^1.2.3"), ">=1.2.3,<2")
+        self.assertEqual(poetry_to_pep440("^0.2.3"), ">=0.2.3,<0.3")
+        self.assertEqual(poetry_to_pep440("^0.0.3"), ">=0.0.3,<0.0.4")
+
+    def test_tilde(self):
+        self.assertEqual(poetry_to_pep440("~1.2.3"), ">=1.2.3,<1.3")
+        self.assertEqual(poetry_to_pep440("~1"), ">=1,<2")
+
+    def test_bare_version_is_exact(self):
+        self.assertEqual(poetry_to_pep440("1.2.3"), "==1.2.3")
+        self.assertEqual(poetry_to_pep440("1.2.*"), "==1.2.*")
+
+    def test_any(self):
+        self.assertEqual(poetry_to_pep440("*"), "")
+        self.assertEqual(poetry_to_pep440(""), "")
+
+    def test_comparisons(self):
+        self.assertEqual(poetry_to_pep440(">=1.0"), ">=1.0")
+        self.assertEqual(poetry_to_pep440(">= 1.0, < 2.0"), ">=1.0,<2.0")
+        self.assertEqual(poetry_to_pep440("==1.2.3"), "==1.2.3")
+        self.assertEqual(poetry_to_pep440("!=1.5"), "!=1.5")
+        self.assertEqual(poetry_to_pep440("~=1.4"), "~=1.4")
+
+    def test_not_expressible(self):
+        self.assertEqual(poetry_to_pep440("@git+https://example.com/x"), None)
+        self.assertEqual(poetry_to_pep440("^1.0 || ^2.0"), None)
@@ -0,0 +1,112 @@
+import threading
+import time
+import unittest
+
+from msnake.scheduler import run_strategies
+
+
+class FakeStrategy:
+    def __init__(self, name, log, dependencies=(), action=None):
+        self.name = name
+        self.log = log
+        self.dependencies = list(dependencies)
+        self.action = action
+
+    def ensure(self):
+        self.log.append(("start", self.name))
+        if self.action is not None:
+            self.action()
+        self.log.append(("end", self.name))
+        return True
+
+    def __repr__(self):
+        return self.name
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def test_dependency_order(self):
+        log = []
+        docker = FakeStrategy("docker", log)
+        python = FakeStrategy("python", log, [docker])
+        r = FakeStrategy("r", log, [docker])
+        venv = FakeStrategy("venv", log, [python])
+        rpy2 = FakeStrategy("rpy2", log, [python, r])
+        done = []
+        self.assertTrue(
+            run_strategies([rpy2, venv, r, python, docker], 4, on_done=done.append)
+        )
+        for s in [python, r, venv, rpy2]:
+            for dep in s.dependencies:
+                self.assertLess(
+                    log.index(("end", dep.name)), log.index(("start", s.name))
+                )
+        self.assertEqual(set(done), set([docker, python, r, venv, rpy2]))
+
+    def test_unscheduled_dependencies_are_ignored(self):
+        log = []
+        docker = FakeStrategy("docker", log)
+        python = FakeStrategy("python", log, [docker])
+        run_strategies([python])
+        self.assertEqual(log, [("start", "python"), ("end", "python")])
+
+    def test_failure_stops_dependents(self):
+        log = []
+
+        def fail():
+            raise ValueError("build failed")
+
+        docker = FakeStrategy("docker", log)
+        python = FakeStrategy("python", log, [docker], action=fail)
+        venv = FakeStrategy("venv", log, [python])
+        clone = FakeStrategy("clone", log)
+        done = []
+        with self.assertRaises(ValueError):
+            run_strategies([docker, python, venv, clone], 1, on_done=done.append)
+        self.assertFalse(("start", "venv") in log)
+        self.assertFalse(python in done)
+        self.assertTrue(docker in done)
+
+    def test_max_parallel(self):
+        lock = threading.Lock()
+        counts = {"now": 0, "max": 0}
+
+        def busy():
+            with lock:
+                counts["now"] += 1
+                counts["max"] = max(counts["max"], counts["now"])
+            time.sleep(0.05)
+            with lock:
+                counts["now"] -= 1
+
+        log = []
+        strategies = [FakeStrategy(str(i), log, action=busy) for i in range(6)]
+        run_strategies(strategies, 2)
+        self.assertEqual(counts["max"], 2)
+        self.assertEqual(len(log), 12)
+
+    def test_circular_dependencies(self):
+        log = []
+        a = FakeStrategy("a", log)
+        b = FakeStrategy("b", log, [a])
+        a.dependencies.append(b)
+        with self.assertRaises(ValueError):
+            run_strategies([a, b])
+
+    def test_interrupt_stops_running_strategies(self):
+        log = []
+        killed = threading.Event()
+        slow = FakeStrategy("slow", log, action=lambda: killed.wait(10))
+        fast = FakeStrategy("fast", log)
+        queued = FakeStrategy("queued", log, [fast])
+
+        def interrupt(strategy):  # ctrl-c arrives in the main thread
+            raise KeyboardInterrupt()
+
+        start = time.time()
+        with self.assertRaises(KeyboardInterrupt):
+            run_strategies(
+                [slow, fast, queued], 2, on_done=interrupt, on_interrupt=killed.set
+            )
+        self.assertTrue(killed.is_set())
+        self.assertLess(time.time() - start, 5)
+        self.assertFalse(("start", "queued") in log)
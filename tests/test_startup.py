@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+# cumulative import time (microseconds) msnake.cli may take - generous, it's
+# about 30ms on a warm disk cache, pulling in docker & co. takes far longer
+budget_us = 250000
+# heavy modules that only the commands needing them may import
+deferred_modules = [
+    "docker",
+    "requests",
+    "tomlkit",
+    "pkg_resources",
+    "click_completion",
+]
+
+check_script = """
+import json, sys
+import {module}
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def run_python(*args):
+    """Run a fresh interpreter with our src on the PYTHONPATH -> (stdout, stderr)"""
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(Path(__file__).parent.parent / "src")]
+        + [x for x in [env.get("PYTHONPATH")] if x]
+    )
+    env.pop("_MSNAKE_COMPLETE", None)
+    p = subprocess.Popen(
+        [sys.executable] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+    )
+    stdout, stderr = p.communicate()
+    if p.returncode != 0:
+        raise ValueError("import failed: %s" % stderr.decode("utf-8"))
+    return stdout.decode("utf-8"), stderr.decode("utf-8")
+
+
+def loaded_modules(module):
+    """The sys.modules of a fresh interpreter after importing module"""
+    stdout, _ = run_python("-c", check_script.format(module=module))
+    return set(json.loads(stdout.strip().split("\n")[-1]))
+
+
+def import_times(module):
+    """module -> cumulative import time in microseconds, via python -X importtime"""
+    _, stderr = run_python("-X", "importtime", "-c", "import " + module)
+    result = {}
+    for line in stderr.split("\n"):
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            try:
+                result[name.strip()] = int(cumulative)
+            except ValueError:  # header line
+                continue
+    return result
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_cli_defers_heavy_imports(self):
+        modules = loaded_modules("msnake.cli")
+        self.assertTrue("msnake.cli" in modules)
+        for module in deferred_modules:
+            self.assertFalse(module in modules, "%s imported at startup" % module)
+
+    def test_cli_import_budget(self):
+        # best of three - the first run may pay for a cold disk cache
+        best = min(import_times("msnake.cli")["msnake.cli"] for i in range(3))
+        self.assertLess(best, budget_us)
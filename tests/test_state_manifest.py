@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from msnake.state_manifest import StateManifest
+
+
+class FakeAnysnake:
+    def __init__(self, base):
+        self.base = base
+        self.version = "1"
+        self.image_present = True
+
+
+class Image:
+    created = 0
+
+    def __init__(self, anysnake):
+        Image.created += 1
+        self.anysnake = anysnake
+
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {}
+
+    def get_artifacts(self):
+        return []
+
+    @staticmethod
+    def is_present(anysnake):
+        return anysnake.image_present
+
+
+class Build(Image):
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {"version": anysnake.version}
+
+    def get_artifacts(self):
+        return [self.anysnake.base / "build"]
+
+
+class Venv(Image):
+    @staticmethod
+    def get_fingerprint(anysnake):
+        return {}
+
+    def get_artifacts(self):
+        return [self.anysnake.base / "venv"]
+
+
+dependencies = {Image: [], Build: [Image], Venv: [Build]}
+
+
+class StateManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.base = Path(self.temp_dir.name)
+        self.anysnake = FakeAnysnake(self.base)
+        self.filename = self.base / "state" / "manifest.json"
+        (self.base / "build").write_text("build")
+        (self.base / "venv").write_text("venv")
+        manifest = StateManifest(self.filename, self.anysnake)
+        for cls in dependencies:
+            manifest.record(cls(self.anysnake))
+        manifest.save()
+        Image.created = 0
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def find_stale(self):
+        return StateManifest(self.filename, self.anysnake).find_stale(dependencies)
+
+    def test_current_without_creating_strategies(self):
+        self.assertEqual(self.find_stale(), [])
+        self.assertEqual(Image.created, 0)
+        self.assertEqual(
+            [x.name for x in self.filename.parent.iterdir()], [self.filename.name]
+        )
+
+    def test_config_change_propagates_to_dependents(self):
+        self.anysnake.version = "2"
+        self.assertEqual(self.find_stale(), [Build, Venv])
+
+    def test_changed_artifact(self):
+        (self.base / "venv").write_text("changed venv")
+        self.assertEqual(self.find_stale(), [Venv])
+
+    def test_missing_image(self):
+        self.anysnake.image_present = False
+        self.assertEqual(self.find_stale(), [Image, Build, Venv])
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from msnake.util import sync_files
+
+script_count = 50
+# a venv's bin with many console scripts
+benchmark_count = 800
+# a no-op sync of benchmark_count scripts may take at most this many seconds
+# (generous - the suite runs under coverage)
+budget_s = 1.0
+
+
+def rewrite(input):
+    return input.replace(b"#!/global/bin/python", b"#!/code/bin/python", 1)
+
+
+class SyncFilesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        base = Path(self.temp_dir.name)
+        self.source = base / "global_bin"
+        self.target = base / "code_bin"
+        self.manifest = base / "manifest.json"
+        self.source.mkdir()
+        self.target.mkdir()
+        self.write_scripts(script_count)
+        (self.source / "python").write_bytes(b"binary")
+        (self.target / "python").write_bytes(b"our own binary")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_scripts(self, count):
+        for i in range(count):
+            fn = self.source / ("script_%i" % i)
+            fn.write_bytes(b"#!/global/bin/python\nimport sys\nsys.exit(%i)\n" % i)
+            fn.chmod(0o755)
+
+    def test_sync(self):
+        written, removed = sync_files(self.source, self.target, self.manifest, rewrite)
+        self.assertEqual(len(written), script_count)
+        self.assertEqual(removed, [])
+        self.assertTrue(
+            (self.target / "script_1").read_bytes().startswith(b"#!/code/bin/python\n")
+        )
+        self.assertTrue(os.access(str(self.target / "script_1"), os.X_OK))
+        self.assertEqual((self.target / "python").read_bytes(), b"our own binary")
+
+        (self.source / "script_2").write_bytes(b"#!/global/bin/python\nchanged\n")
+        (self.source / "script_3").unlink()
+        (self.source / "new").write_bytes(b"#!/bin/sh\n")
+        written, removed = sync_files(self.source, self.target, self.manifest, rewrite)
+        self.assertEqual(sorted(written), ["new", "script_2"])
+        self.assertEqual(removed, ["script_3"])
+        self.assertEqual(
+            (self.target / "script_2").read_bytes(), b"#!/code/bin/python\nchanged\n"
+        )
+        self.assertFalse((self.target / "script_3").exists())
+        self.assertEqual((self.target / "python").read_bytes(), b"our own binary")
+
+    def test_noop_sync_leaves_target_untouched(self):
+        sync_files(self.source, self.target, self.manifest, rewrite)
+        # push the copies into the past, so any rewrite shows up in the mtimes
+        for fn in self.target.iterdir():
+            os.utime(str(fn), (1000000000, 1000000000))
+        before = {fn.name: fn.stat().st_mtime for fn in self.target.iterdir()}
+        written, removed = sync_files(self.source, self.target, self.manifest, rewrite)
+        self.assertEqual((written, removed), ([], []))
+        after = {fn.name: fn.stat().st_mtime for fn in self.target.iterdir()}
+        self.assertEqual(after, before)
+
+    def test_benchmark(self):
+        self.write_scripts(benchmark_count)
+        start = time.time()
+        written, removed = sync_files(self.source, self.target, self.manifest, rewrite)
+        sync_time = time.time() - start
+        self.assertEqual(len(written), benchmark_count)
+        start = time.time()
+        written, removed = sync_files(self.source, self.target, self.manifest, rewrite)
+        noop_time = time.time() - start
+        self.assertEqual((written, removed), ([], []))
+        print("sync: %.3fs, no-op sync: %.3fs" % (sync_time, noop_time))
+        self.assertLess(noop_time, budget_s)
+        self.assertLess(noop_time, sync_time)